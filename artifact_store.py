@@ -0,0 +1,117 @@
+#Per-session output artifacts
+#Every consult gets its own uniquely named, atomically written output files, so
+#concurrent sessions never overwrite or half-read each other's audio.
+import os
+import re
+import time
+import uuid
+import shutil
+import threading
+from contextlib import contextmanager
+
+ARTIFACT_DIR=os.environ.get("ARTIFACT_DIR", os.path.join(".cache", "artifacts"))
+ARTIFACT_MAX_AGE=float(os.environ.get("ARTIFACT_MAX_AGE", 3600))
+ARTIFACT_MAX_BYTES=int(os.environ.get("ARTIFACT_MAX_BYTES", 500 * 1024 * 1024))
+ARTIFACT_GC_INTERVAL=float(os.environ.get("ARTIFACT_GC_INTERVAL", 300))
+
+_unsafe_chars=re.compile(r"[^A-Za-z0-9_-]")
+_gc_thread=None
+_gc_lock=threading.Lock()
+
+
+def session_dir(session_id=None):
+    safe_id=_unsafe_chars.sub("", session_id or "") or "anonymous"
+    return os.path.join(ARTIFACT_DIR, safe_id)
+
+
+def new_artifact_path(session_id=None, suffix=".mp3"):
+    """Unique path for a new output file of this session."""
+    directory=session_dir(session_id)
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, uuid.uuid4().hex + suffix)
+
+
+@contextmanager
+def atomic_output(path):
+    """Yields a temporary path to write to; it is moved onto path only if the block succeeds."""
+    root, suffix=os.path.splitext(path)
+    tmp_path=f"{root}.tmp-{uuid.uuid4().hex}{suffix}"
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def collect_garbage(max_age=None, max_bytes=None):
+    """Delete artifacts older than max_age, then the oldest ones until the store fits in max_bytes."""
+    max_age=ARTIFACT_MAX_AGE if max_age is None else max_age
+    max_bytes=ARTIFACT_MAX_BYTES if max_bytes is None else max_bytes
+    now=time.time()
+    artifacts=[]
+    removed=0
+    for directory, _, filenames in os.walk(ARTIFACT_DIR):
+        for filename in filenames:
+            path=os.path.join(directory, filename)
+            try:
+                stat=os.stat(path)
+            except OSError:
+                continue
+            if now - stat.st_mtime > max_age:
+                removed+=_remove(path)
+            else:
+                artifacts.append((stat.st_mtime, stat.st_size, path))
+
+    total_bytes=sum(size for _, size, _ in artifacts)
+    for _, size, path in sorted(artifacts):
+        if total_bytes <= max_bytes:
+            break
+        removed+=_remove(path)
+        total_bytes-=size
+
+    _remove_empty_session_dirs(now, max_age)
+    return removed
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+        return 1
+    except OSError:
+        return 0
+
+
+def _remove_empty_session_dirs(now, max_age):
+    try:
+        entries=os.listdir(ARTIFACT_DIR)
+    except OSError:
+        return
+    for name in entries:
+        directory=os.path.join(ARTIFACT_DIR, name)
+        try:
+            if os.path.isdir(directory) and not os.listdir(directory) and now - os.path.getmtime(directory) > max_age:
+                shutil.rmtree(directory, ignore_errors=True)
+        except OSError:
+            continue
+
+
+def start_garbage_collector(interval=None):
+    """Run collect_garbage every interval seconds in a daemon thread (started once per process)."""
+    global _gc_thread
+    interval=ARTIFACT_GC_INTERVAL if interval is None else interval
+    with _gc_lock:
+        if _gc_thread is not None:
+            return _gc_thread
+
+        def run():
+            while True:
+                try:
+                    collect_garbage()
+                except Exception as e:
+                    print(f"Artifact garbage collection failed: {e}")
+                time.sleep(interval)
+
+        _gc_thread=threading.Thread(target=run, name="artifact-gc", daemon=True)
+        _gc_thread.start()
+        return _gc_thread
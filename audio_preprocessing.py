@@ -0,0 +1,74 @@
+#Audio preprocessing before Whisper
+#Recordings are converted to 16 kHz mono in a compact codec, trimmed of leading and
+#trailing silence, and long ones are split on pauses so chunks can be transcribed in parallel.
+#pydub is imported on first use, so the app starts without it.
+import os
+
+AUDIO_SAMPLE_RATE=int(os.environ.get("AUDIO_SAMPLE_RATE", 16000))
+AUDIO_EXPORT_FORMAT=os.environ.get("AUDIO_EXPORT_FORMAT", "mp3")
+AUDIO_EXPORT_BITRATE=os.environ.get("AUDIO_EXPORT_BITRATE", "32k")
+#Frames quieter than the recording's average loudness minus this many dB count as silence
+SILENCE_BELOW_AVERAGE_DB=float(os.environ.get("SILENCE_BELOW_AVERAGE_DB", 16))
+MIN_PAUSE_MS=int(os.environ.get("MIN_PAUSE_MS", 400))
+CHUNK_THRESHOLD_SECONDS=float(os.environ.get("CHUNK_THRESHOLD_SECONDS", 60))
+MAX_CHUNK_SECONDS=float(os.environ.get("MAX_CHUNK_SECONDS", 30))
+
+
+def normalize_audio(segment):
+    """16 kHz mono, the format Whisper works in internally."""
+    return segment.set_frame_rate(AUDIO_SAMPLE_RATE).set_channels(1)
+
+
+def silence_threshold(segment):
+    if segment.dBFS == float("-inf"):
+        return -60.0
+    return segment.dBFS - SILENCE_BELOW_AVERAGE_DB
+
+
+def trim_silence(segment):
+    """Energy-based trim of leading and trailing silence."""
+    from pydub.silence import detect_leading_silence
+
+    threshold=silence_threshold(segment)
+    start_ms=detect_leading_silence(segment, silence_threshold=threshold)
+    end_ms=len(segment) - detect_leading_silence(segment.reverse(), silence_threshold=threshold)
+    if end_ms <= start_ms:
+        return segment
+    return segment[start_ms:end_ms]
+
+
+def split_on_pauses(segment, max_chunk_ms):
+    """Cut the recording at the pause closest to each max_chunk_ms boundary (hard cut if there is none)."""
+    from pydub.silence import detect_silence
+
+    pauses=detect_silence(segment, min_silence_len=MIN_PAUSE_MS, silence_thresh=silence_threshold(segment))
+    cut_points=[(start + end) // 2 for start, end in pauses]
+
+    chunks=[]
+    chunk_start=0
+    while len(segment) - chunk_start > max_chunk_ms:
+        limit=chunk_start + max_chunk_ms
+        candidates=[cut for cut in cut_points if chunk_start < cut <= limit]
+        chunk_end=candidates[-1] if candidates else limit
+        chunks.append(segment[chunk_start:chunk_end])
+        chunk_start=chunk_end
+    chunks.append(segment[chunk_start:])
+    return chunks
+
+
+def prepare_audio_chunks(audio_filepath, output_dir):
+    """Normalize and trim a recording, split it if it is long, and export the chunks to output_dir."""
+    from pydub import AudioSegment
+
+    segment=trim_silence(normalize_audio(AudioSegment.from_file(audio_filepath)))
+    if len(segment) > CHUNK_THRESHOLD_SECONDS * 1000:
+        chunks=split_on_pauses(segment, int(MAX_CHUNK_SECONDS * 1000))
+    else:
+        chunks=[segment]
+
+    chunk_paths=[]
+    for index, chunk in enumerate(chunks):
+        chunk_path=os.path.join(output_dir, f"chunk_{index:03d}.{AUDIO_EXPORT_FORMAT}")
+        chunk.export(chunk_path, format=AUDIO_EXPORT_FORMAT, bitrate=AUDIO_EXPORT_BITRATE)
+        chunk_paths.append(chunk_path)
+    return chunk_paths
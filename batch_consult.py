@@ -0,0 +1,142 @@
+#Headless batch consultations
+#Runs the same pipeline as the Gradio "Analyze" button over a JSONL manifest of cases,
+#without launching the UI. One case per line, for example:
+#  {"case_id": "rash-001", "audio": "cases/rash.mp3", "images": ["cases/rash.jpg"], "symptoms": ["Fever", "Chills"]}
+#Results are streamed to a JSONL file as cases finish; re-running with the same output
+#file resumes from it and skips the cases that already succeeded.
+#
+#Usage: python batch_consult.py cases.jsonl --output results.jsonl --workers 8
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import metrics
+from gradio_app import process_inputs, consult_error
+
+
+def read_manifest(manifest_path):
+    with open(manifest_path, encoding="utf-8") as manifest:
+        for line_number, line in enumerate(manifest, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            case = json.loads(line)
+            case.setdefault("case_id", f"line-{line_number}")
+            yield case
+
+
+def completed_case_ids(output_path):
+    """Case ids that already have a successful result in output_path (the checkpoint)"""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, encoding="utf-8") as results:
+        for line in results:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                # A line cut short by an interrupted run
+                continue
+            if result.get("status") == "ok":
+                completed.add(result["case_id"])
+    return completed
+
+
+def as_list(value):
+    if not value:
+        return []
+    return [value] if isinstance(value, str) else list(value)
+
+
+def run_case(case):
+    """Run one case through process_inputs and return its result record"""
+    audio_paths = as_list(case.get("audio"))
+    image_paths = as_list(case.get("images") or case.get("image"))
+    result = {"case_id": case["case_id"]}
+    warnings = []
+    if len(audio_paths) > 1:
+        warnings.append(f"only the first of {len(audio_paths)} recordings is used")
+    if warnings:
+        result["warnings"] = warnings
+
+    started_at = time.perf_counter()
+    trace = metrics.RequestTrace()
+    try:
+        outputs = None
+        for outputs in process_inputs(
+            audio_paths[0] if audio_paths else None,
+            image_paths,
+            case.get("symptoms") or None,
+            request=SimpleNamespace(session_hash=f"batch-{case['case_id']}"),
+            trace=trace
+        ):
+            pass
+        speech_to_text_output, doctor_response, voice_of_doctor = outputs
+        result.update(
+            symptoms_summary=speech_to_text_output,
+            doctor_response=doctor_response,
+            voice_path=voice_of_doctor
+        )
+        # The pipeline answers even when a backend failed; such cases must be retried on resume
+        error = consult_error(trace)
+        if error:
+            result.update(status="error", error=error)
+        else:
+            result["status"] = "ok"
+    except Exception as e:
+        result.update(status="error", error=f"{type(e).__name__}: {e}")
+    result["seconds"] = round(time.perf_counter() - started_at, 3)
+    return result
+
+
+def run_batch(manifest_path, output_path, workers=4, max_pending=None):
+    """Run every pending case on a bounded thread pool, appending results as they finish"""
+    max_pending = max_pending or workers * 2
+    completed = completed_case_ids(output_path)
+    write_lock = threading.Lock()
+    counts = {"ok": 0, "error": 0, "skipped": 0}
+
+    with open(output_path, "a", encoding="utf-8") as results, ThreadPoolExecutor(max_workers=workers) as pool:
+        def record(future):
+            result = future.result()
+            with write_lock:
+                results.write(json.dumps(result, ensure_ascii=False) + "\n")
+                results.flush()
+                counts[result["status"]] += 1
+            print(f"[{result['status']}] {result['case_id']} ({result['seconds']}s)")
+
+        pending = set()
+        for case in read_manifest(manifest_path):
+            if case["case_id"] in completed:
+                counts["skipped"] += 1
+                continue
+            # Keep at most max_pending cases in flight so huge manifests are never loaded at once
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            future = pool.submit(run_case, case)
+            future.add_done_callback(record)
+            pending.add(future)
+        wait(pending)
+
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run AI Doctor consultations over a JSONL manifest of cases")
+    parser.add_argument("manifest", help="JSONL file with one case per line")
+    parser.add_argument("--output", "-o", default="results.jsonl", help="JSONL results file, also used to resume")
+    parser.add_argument("--workers", "-w", type=int, default=4, help="cases processed at the same time (beyond QUICK_CONCURRENCY/IMAGE_CONCURRENCY they wait for admission)")
+    args = parser.parse_args()
+
+    counts = run_batch(args.manifest, args.output, workers=args.workers)
+    print(f"✅ Done: {counts['ok']} ok, {counts['error']} failed, {counts['skipped']} already completed")
+    return 1 if counts["error"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
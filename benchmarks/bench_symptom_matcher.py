@@ -0,0 +1,72 @@
+#Benchmark: per-query cost of symptom matching as the condition table grows
+#Compares the compiled SymptomMatcher with the original linear set-intersection scan.
+#Usage: python benchmarks/bench_symptom_matcher.py [--sizes 10 100 1000 10000]
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from symptom_matcher import SymptomMatcher
+
+
+def synthetic_solutions(condition_count, vocabulary_size, rng):
+    vocabulary = [f"Symptom {i}" for i in range(vocabulary_size)]
+    return {
+        f"condition_{i}": {
+            "symptoms": rng.sample(vocabulary, rng.randint(2, 8)),
+            "condition": f"Condition {i}",
+            "advice": "",
+            "urgency": "",
+        }
+        for i in range(condition_count)
+    }, vocabulary
+
+
+def linear_scan(solutions, selected_symptoms):
+    """The original detect_condition_from_symptoms loop"""
+    symptom_set = set(selected_symptoms)
+    best_match = None
+    highest_match_count = 0
+    for condition_data in solutions.values():
+        match_count = len(symptom_set.intersection(condition_data["symptoms"]))
+        if match_count >= 2 and match_count > highest_match_count:
+            highest_match_count = match_count
+            best_match = condition_data
+    return best_match
+
+
+def time_per_query(match, queries):
+    start = time.perf_counter()
+    for query in queries:
+        match(query)
+    return (time.perf_counter() - start) / len(queries) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Symptom matching cost vs. condition table size")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--vocabulary", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    print(f"{'conditions':>10} {'compile ms':>11} {'matcher us/query':>17} {'linear us/query':>16}")
+    for size in args.sizes:
+        rng = random.Random(args.seed)
+        solutions, vocabulary = synthetic_solutions(size, args.vocabulary, rng)
+        queries = [rng.sample(vocabulary, rng.randint(2, 5)) for _ in range(args.queries)]
+
+        start = time.perf_counter()
+        matcher = SymptomMatcher(solutions)
+        compile_ms = (time.perf_counter() - start) * 1000
+
+        matcher_us = time_per_query(matcher.best_match, queries)
+        linear_us = time_per_query(lambda query: linear_scan(solutions, query), queries)
+        print(f"{size:>10} {compile_ms:>11.1f} {matcher_us:>17.1f} {linear_us:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
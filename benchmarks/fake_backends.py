@@ -0,0 +1,196 @@
+#Local stand-ins for the Groq and gTTS HTTP APIs
+#A small threaded HTTP server that answers chat completions (plain and streamed),
+#Whisper transcriptions and gTTS batchexecute calls with configurable latency and
+#payload sizes, so the hot path can be measured without calling paid APIs.
+import os
+import json
+import time
+import base64
+import random
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+DEFAULT_CONFIG = {
+    "chat_first_token_ms": 250,
+    "chat_token_ms": 5,
+    "chat_response_tokens": 60,
+    "transcription_ms": 300,
+    "transcription_words": 25,
+    "tts_ms": 200,
+    "tts_audio_bytes": 24000,
+    "chat_slow_fraction": 0.0,
+    "chat_slow_ms": 3000,
+    "rate_limit_fraction": 0.0,
+    "retry_after_s": 1.0,
+    "seed": 7,
+}
+
+_WORDS = ["rest", "fluids", "fever", "rash", "mild", "infection", "cream", "doctor", "days", "skin",
+          "symptoms", "monitor", "pain", "swelling", "advice", "sleep", "water", "see", "if", "persists"]
+
+
+class FakeBackendHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def config(self):
+        return self.server.config
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.count(self.path)
+        if not self.path.endswith("/batchexecute") and self.server.rate_limited():
+            self.rate_limit()
+        elif self.path.endswith("/chat/completions"):
+            self.chat_completion(json.loads(body))
+        elif self.path.endswith("/audio/transcriptions"):
+            self.transcription()
+        elif self.path.endswith("/batchexecute"):
+            self.gtts()
+        else:
+            self.send_error(404)
+
+    def send_body(self, content_type, payload):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def rate_limit(self):
+        payload = json.dumps({"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}}).encode()
+        self.send_response(429)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Retry-After", str(self.config["retry_after_s"]))
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def chat_completion(self, request):
+        tokens = self.server.words(self.config["chat_response_tokens"])
+        time.sleep(self.config["chat_first_token_ms"] / 1000)
+        if self.server.slow_chat():
+            time.sleep(self.config["chat_slow_ms"] / 1000)
+        if not request.get("stream"):
+            time.sleep(self.config["chat_token_ms"] * len(tokens) / 1000)
+            self.send_body("application/json", json.dumps({
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": 0,
+                "model": request["model"],
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": " ".join(tokens)},
+                    "finish_reason": "stop",
+                }],
+                "usage": {"prompt_tokens": 100, "completion_tokens": len(tokens), "total_tokens": 100 + len(tokens)},
+            }).encode())
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for index, token in enumerate(tokens):
+                if index:
+                    time.sleep(self.config["chat_token_ms"] / 1000)
+                chunk = {
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion.chunk",
+                    "created": 0,
+                    "model": request["model"],
+                    "choices": [{"index": 0, "delta": {"content": token + " "}, "finish_reason": None}],
+                }
+                self.write_chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.write_chunk(b"data: [DONE]\n\n")
+            self.write_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client closed the stream early (e.g. a hedged request that lost)
+            self.close_connection = True
+
+    def write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def transcription(self):
+        time.sleep(self.config["transcription_ms"] / 1000)
+        text = " ".join(self.server.words(self.config["transcription_words"]))
+        self.send_body("application/json", json.dumps({"text": text}).encode())
+
+    def gtts(self):
+        time.sleep(self.config["tts_ms"] / 1000)
+        audio = base64.b64encode(b"\xff\xf3" * (self.config["tts_audio_bytes"] // 2)).decode()
+        line = f'[["wrb.fr","jQ1olc","[\\"{audio}\\"]",null,null,null,"generic"]]'
+        self.send_body("application/json", f")]}}'\n\n{len(line)}\n{line}\n".encode())
+
+
+class FakeBackendServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, config=None, port=0):
+        super().__init__(("127.0.0.1", port), FakeBackendHandler)
+        self.config = dict(DEFAULT_CONFIG, **(config or {}))
+        self.request_counts = {}
+        self._rng = random.Random(self.config["seed"])
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def count(self, path):
+        with self._lock:
+            self.request_counts[path] = self.request_counts.get(path, 0) + 1
+
+    def slow_chat(self):
+        """Whether this chat answer is in the slow tail (chat_slow_fraction of them)."""
+        if self.config["chat_slow_fraction"] <= 0:
+            return False
+        with self._lock:
+            return self._rng.random() < self.config["chat_slow_fraction"]
+
+    def rate_limited(self):
+        """Whether to answer this Groq request with a 429 (rate_limit_fraction of them)."""
+        if self.config["rate_limit_fraction"] <= 0:
+            return False
+        with self._lock:
+            return self._rng.random() < self.config["rate_limit_fraction"]
+
+    def words(self, count):
+        with self._lock:
+            return [self._rng.choice(_WORDS) for _ in range(count)]
+
+
+@contextmanager
+def fake_backends(config=None):
+    """Start the fake server and point Groq and gTTS at it for the duration of the block.
+
+    Must be entered before the first Groq client is created (GROQ_BASE_URL is read then).
+    """
+    import gtts.tts
+
+    server = FakeBackendServer(config)
+    thread = threading.Thread(target=server.serve_forever, name="fake-backends", daemon=True)
+    thread.start()
+
+    previous_base_url = os.environ.get("GROQ_BASE_URL")
+    previous_translate_url = gtts.tts._translate_url
+    os.environ["GROQ_BASE_URL"] = server.url
+    os.environ.setdefault("GROQ_API_KEY", "fake-key")
+    gtts.tts._translate_url = lambda tld="com", path="": f"{server.url}/{path}"
+    try:
+        yield server
+    finally:
+        gtts.tts._translate_url = previous_translate_url
+        if previous_base_url is None:
+            os.environ.pop("GROQ_BASE_URL", None)
+        else:
+            os.environ["GROQ_BASE_URL"] = previous_base_url
+        server.shutdown()
+        server.server_close()
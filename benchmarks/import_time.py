@@ -0,0 +1,76 @@
+#Import-time report for the app's cold start
+#Runs `python -X importtime -c "import <module>"` in a fresh interpreter and summarizes
+#where the time goes: total, the slowest top-level packages and the slowest modules.
+#
+#Usage:
+#  python benchmarks/import_time.py                     # gradio_app
+#  python benchmarks/import_time.py --module batch_consult --top 15 --output import_time.json
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(module):
+    """(module, self_us, cumulative_us, depth) for every import, in the order they finished."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return imports
+
+
+def summarize(module, imports, top):
+    total_us = next(cumulative for name, _, cumulative, _ in reversed(imports) if name == module)
+    packages = {}
+    for name, self_us, _, _ in imports:
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0) + self_us
+    slowest_modules = sorted(imports, key=lambda entry: entry[1], reverse=True)[:top]
+    return {
+        "module": module,
+        "total_ms": round(total_us / 1000, 1),
+        "modules_imported": len(imports),
+        "packages": [{"package": package, "self_ms": round(us / 1000, 1)}
+                     for package, us in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]],
+        "slowest_modules": [{"module": name, "self_ms": round(self_us / 1000, 1)}
+                            for name, self_us, _, _ in slowest_modules],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize `python -X importtime` for an app module")
+    parser.add_argument("--module", default="gradio_app")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--output", help="write the summary as JSON")
+    args = parser.parse_args()
+
+    report = summarize(args.module, measure(args.module), args.top)
+    print(f"import {report['module']}: {report['total_ms']} ms, {report['modules_imported']} modules")
+    print(f"\n{'package':<40}{'self ms':>10}")
+    for entry in report["packages"]:
+        print(f"{entry['package']:<40}{entry['self_ms']:>10}")
+    print(f"\n{'module':<60}{'self ms':>10}")
+    for entry in report["slowest_modules"]:
+        print(f"{entry['module']:<60}{entry['self_ms']:>10}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(report, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+#Concurrent load test against the Gradio app
+#Drives the "consult" API of a running demo with N simulated patients sending a mix of
+#symptom-only, audio and image cases, and reports throughput, p50/p95/p99 latency per
+#stage and error rates. By default it starts its own app in a subprocess with Groq and
+#gTTS stubbed by benchmarks/fake_backends.py.
+#
+#Usage:
+#  python benchmarks/load_test.py --patients 16 --duration 60 --concurrency 8
+#  python benchmarks/load_test.py --url http://127.0.0.1:7861 --patients 16    # an already running app
+import os
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+WORKLOADS = {
+    # name: (share of traffic, needs audio, needs image, symptoms)
+    "symptoms_predefined": (0.4, False, False, ["🤒 Fever", "🌡️ Chills", "🥴 Fatigue"]),
+    "symptoms_llm": (0.2, False, False, ["👂 Ear Pain"]),
+    "audio": (0.2, True, False, ["🤕 Headache"]),
+    "image": (0.2, False, True, []),
+}
+STAGES = ("first_update", "first_answer_text", "complete")
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def serve(port, backend_config):
+    """Run the app with fake backends until killed (the --serve mode of this script)."""
+    from fake_backends import fake_backends
+
+    with fake_backends(backend_config):
+        import gradio_app
+        gradio_app.demo.launch(server_name="127.0.0.1", server_port=port, prevent_thread_lock=True)
+        print("LOAD_TEST_SERVER_READY", flush=True)
+        while True:
+            time.sleep(3600)
+
+
+def start_server(args, workdir):
+    port = free_port()
+    env = dict(
+        os.environ,
+        CONSULT_CONCURRENCY=str(args.concurrency),
+        ARTIFACT_DIR=os.path.join(workdir, "artifacts"),
+        RESPONSE_CACHE_DIR=os.path.join(workdir, "responses"),
+        TTS_CACHE_DIR=os.path.join(workdir, "tts"),
+        TRANSCRIPTION_CACHE_DIR=os.path.join(workdir, "transcriptions"),
+        # Synthetic consults are still recorded (the store's cost is part of the app) but not in .cache
+        CONSULT_STORE_PATH=os.path.join(workdir, "consultations.sqlite3"),
+        RESPONSE_CACHE_ENABLED="0" if args.no_cache else os.environ.get("RESPONSE_CACHE_ENABLED", "1"),
+        TTS_CACHE_ENABLED="0" if args.no_cache else os.environ.get("TTS_CACHE_ENABLED", "1"),
+        TRANSCRIPTION_CACHE_ENABLED="0" if args.no_cache else os.environ.get("TRANSCRIPTION_CACHE_ENABLED", "1"),
+        SIMILARITY_CACHE_ENABLED="0" if args.no_cache else os.environ.get("SIMILARITY_CACHE_ENABLED", "1"),
+    )
+    command = [sys.executable, os.path.abspath(__file__), "--serve", str(port)]
+    if args.set:
+        command += ["--set", *args.set]
+    server = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    for line in server.stdout:
+        if "LOAD_TEST_SERVER_READY" in line:
+            break
+    else:
+        raise RuntimeError("The app under test exited before it was ready")
+    # Keep draining the server output so it never blocks on a full pipe
+    threading.Thread(target=lambda: [None for _ in server.stdout], daemon=True).start()
+    return server, f"http://127.0.0.1:{port}"
+
+
+def make_inputs(workdir, rng):
+    from PIL import Image
+    from pydub.generators import Sine
+
+    image_path = os.path.join(workdir, "rash.jpg")
+    Image.frombytes("RGB", (1024, 1024), rng.randbytes(1024 * 1024 * 3)).save(image_path, quality=90)
+    audio_path = os.path.join(workdir, "patient.wav")
+    Sine(300).to_audio_segment(duration=8000).apply_gain(-12).export(audio_path, format="wav")
+    return audio_path, image_path
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * fraction))], 1)
+
+
+def patient(url, stop_at, max_requests, audio_path, image_path, rng, records, lock):
+    from gradio_client import Client, handle_file
+    # Same criteria as batch_consult: failed stages, open breakers and busy answers all count
+    from gradio_app import answer_error
+
+    client = Client(url, verbose=False)
+    names = list(WORKLOADS)
+    weights = [WORKLOADS[name][0] for name in names]
+    sent = 0
+    while time.monotonic() < stop_at and (max_requests is None or sent < max_requests):
+        workload = rng.choices(names, weights)[0]
+        _, needs_audio, needs_image, symptoms = WORKLOADS[workload]
+        record = {"workload": workload, "error": None}
+        started_at = time.perf_counter()
+        try:
+            job = client.submit(
+                handle_file(audio_path) if needs_audio else None,
+                [handle_file(image_path)] if needs_image else None,
+                symptoms,
+                api_name="/consult",
+            )
+            for outputs in job:
+                elapsed = (time.perf_counter() - started_at) * 1000
+                record.setdefault("first_update", elapsed)
+                if outputs[1]:
+                    record.setdefault("first_answer_text", elapsed)
+            outputs = job.result()
+            record["complete"] = (time.perf_counter() - started_at) * 1000
+            record["error"] = answer_error(outputs)
+        except Exception as e:
+            record["error"] = f"{type(e).__name__}: {e}"
+        with lock:
+            records.append(record)
+        sent += 1
+
+
+def report(records, elapsed):
+    completed = [r for r in records if not r["error"]]
+    summary = {
+        "requests": len(records),
+        "errors": len(records) - len(completed),
+        "error_rate": round((len(records) - len(completed)) / len(records), 4) if records else 0,
+        "throughput_rps": round(len(completed) / elapsed, 3),
+        "workloads": {},
+    }
+    for workload in WORKLOADS:
+        workload_records = [r for r in records if r["workload"] == workload]
+        if not workload_records:
+            continue
+        ok = [r for r in workload_records if not r["error"]]
+        stages = {}
+        for stage in STAGES:
+            samples = [r[stage] for r in ok if stage in r]
+            stages[stage] = {"p50_ms": percentile(samples, 0.50), "p95_ms": percentile(samples, 0.95),
+                             "p99_ms": percentile(samples, 0.99)}
+        summary["workloads"][workload] = {
+            "requests": len(workload_records),
+            "error_rate": round(1 - len(ok) / len(workload_records), 4),
+            "errors": sorted({r["error"] for r in workload_records if r["error"]})[:5],
+            "stages": stages,
+        }
+    return summary
+
+
+def print_summary(summary):
+    print(f"\n{summary['requests']} requests, {summary['throughput_rps']} completed/s, "
+          f"error rate {summary['error_rate']:.2%}")
+    print(f"{'workload':<22}{'stage':<20}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>9}")
+    for workload, stats in summary["workloads"].items():
+        for index, (stage, latency) in enumerate(stats["stages"].items()):
+            error_rate = f"{stats['error_rate']:.1%}" if index == 0 else ""
+            print(f"{workload if index == 0 else '':<22}{stage:<20}"
+                  f"{latency['p50_ms'] or '-':>10}{latency['p95_ms'] or '-':>10}{latency['p99_ms'] or '-':>10}{error_rate:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent load test against the Gradio consult API")
+    parser.add_argument("--url", help="app to test (default: start one with fake backends)")
+    parser.add_argument("--patients", type=int, default=8, help="simulated concurrent patients")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to keep sending requests")
+    parser.add_argument("--requests", type=int, help="requests per patient (overrides --duration)")
+    parser.add_argument("--concurrency", type=int, default=4, help="CONSULT_CONCURRENCY of the started app")
+    parser.add_argument("--no-cache", action="store_true", help="disable the response, TTS, transcription and similar-symptom caches in the started app")
+    parser.add_argument("--set", nargs="*", metavar="NAME=VALUE", help="fake backend settings, see fake_backends.DEFAULT_CONFIG")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="write the summary as JSON")
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    from fake_backends import DEFAULT_CONFIG
+    backend_config = dict(DEFAULT_CONFIG)
+    for override in args.set or []:
+        name, value = override.split("=", 1)
+        backend_config[name] = type(DEFAULT_CONFIG[name])(value)
+
+    if args.serve:
+        serve(args.serve, backend_config)
+        return
+
+    with tempfile.TemporaryDirectory(prefix="ai-doctor-load-") as workdir:
+        server = None
+        url = args.url
+        if not url:
+            server, url = start_server(args, workdir)
+        try:
+            rng = random.Random(args.seed)
+            audio_path, image_path = make_inputs(workdir, rng)
+            records, lock = [], threading.Lock()
+            duration = float("inf") if args.requests else args.duration
+            started_at = time.monotonic()
+            patients = [
+                threading.Thread(target=patient, args=(url, started_at + duration, args.requests, audio_path, image_path,
+                                                       random.Random(args.seed + i), records, lock))
+                for i in range(args.patients)
+            ]
+            for thread in patients:
+                thread.start()
+            for thread in patients:
+                thread.join()
+            summary = report(records, time.monotonic() - started_at)
+        finally:
+            if server:
+                server.terminate()
+                server.wait()
+
+    summary["config"] = {"patients": args.patients, "concurrency": args.concurrency, "backends": backend_config}
+    print_summary(summary)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(summary, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+#Per-stage microbenchmarks of the consultation hot path
+#Measures image encoding, symptom matching, transcription prep, the LLM call, TTS and a
+#full process_inputs run against local fake Groq/gTTS servers, and stores the results as
+#JSON so runs can be compared across commits.
+#
+#Usage:
+#  python benchmarks/run_benchmarks.py                          # writes benchmarks/results/<commit>.json
+#  python benchmarks/run_benchmarks.py --compare benchmarks/results/<old commit>.json
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fake_backends import DEFAULT_CONFIG, fake_backends
+
+MODEL = "meta-llama/llama-4-scout-17b-16e-instruct"
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def measure(function, iterations, warmup=1):
+    for _ in range(warmup):
+        function()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "iterations": iterations,
+        "min_ms": round(samples[0], 3),
+        "median_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        "mean_ms": round(statistics.fmean(samples), 3),
+    }
+
+
+def make_image(path, size, rng):
+    from PIL import Image
+    image = Image.frombytes("RGB", (size, size), rng.randbytes(size * size * 3))
+    image.save(path, format="PNG")
+    return path
+
+
+def make_recording(path, seconds, rng):
+    from pydub import AudioSegment
+    from pydub.generators import Sine
+    speech = Sine(rng.randint(200, 400)).to_audio_segment(duration=2000).apply_gain(-12)
+    pause = AudioSegment.silent(duration=500)
+    recording = pause
+    while len(recording) < seconds * 1000:
+        recording += speech + pause
+    recording.set_channels(2).set_frame_rate(44100).export(path, format="wav")
+    return path
+
+
+def run(args):
+    # Benchmarks must measure the backends, not the caches in front of them
+    os.environ["RESPONSE_CACHE_ENABLED"] = "0"
+    os.environ["TTS_CACHE_ENABLED"] = "0"
+    os.environ["TRANSCRIPTION_CACHE_ENABLED"] = "0"
+    os.environ["TRANSCRIPTION_CACHE_DIR"] = os.path.join(args.workdir, "transcriptions")
+    os.environ["CONSULT_STORE_ENABLED"] = "0"
+    os.environ["CONSULT_STORE_PATH"] = os.path.join(args.workdir, "consultations.sqlite3")
+    os.environ["ARTIFACT_DIR"] = os.path.join(args.workdir, "artifacts")
+    os.environ["KB_COMPILED_DIR"] = os.path.join(args.workdir, "knowledge_base")
+
+    config = dict(DEFAULT_CONFIG)
+    for override in args.set or []:
+        name, value = override.split("=", 1)
+        config[name] = type(DEFAULT_CONFIG[name])(value)
+
+    rng = random.Random(config["seed"])
+    results = {}
+
+    with fake_backends(config) as server:
+        from brain_of_the_doctor import prepare_image, analyze_image_with_query
+        from voice_of_the_doctor import text_to_speech_with_gtts
+        from audio_preprocessing import prepare_audio_chunks
+        from gradio_app import detect_condition_from_symptoms, process_inputs
+
+        images = {size: make_image(os.path.join(args.workdir, f"image_{size}.png"), size, rng) for size in args.image_sizes}
+        for size, image_path in images.items():
+            results[f"encode_image[{size}px]"] = measure(lambda: prepare_image(image_path), args.iterations)
+
+        symptom_sets = [["🤒 Fever", "🌡️ Chills", "🥴 Fatigue"], ["🤕 Headache", "😵 Dizziness"], ["👂 Ear Pain"]]
+        results["detect_condition_from_symptoms"] = measure(
+            lambda: [detect_condition_from_symptoms(symptoms) for symptoms in symptom_sets], args.iterations * 20
+        )
+
+        recording = None
+        try:
+            recording = make_recording(os.path.join(args.workdir, "recording.wav"), args.audio_seconds, rng)
+            with tempfile.TemporaryDirectory() as chunk_dir:
+                results[f"transcription_prep[{args.audio_seconds}s]"] = measure(
+                    lambda: prepare_audio_chunks(recording, chunk_dir), args.iterations
+                )
+        except Exception as e:
+            recording = None
+            print(f"Skipping transcription prep (FFmpeg needed): {e}")
+
+        encoded_image, mime_type = prepare_image(images[args.image_sizes[0]])
+        results["llm_call"] = measure(
+            lambda: analyze_image_with_query("Is there something wrong?", MODEL, encoded_image, mime_type), args.iterations
+        )
+
+        answer = " ".join(server.words(config["chat_response_tokens"]))
+        tts_path = os.path.join(args.workdir, "tts.mp3")
+        results["tts"] = measure(lambda: text_to_speech_with_gtts(answer, tts_path), args.iterations)
+
+        def full_consult():
+            for _ in process_inputs(recording, images[args.image_sizes[0]], ["🤒 Fever", "🤕 Headache"]):
+                pass
+        results["process_inputs"] = measure(full_consult, args.iterations)
+
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": config,
+        "results": results,
+    }
+
+
+def compare(report, baseline):
+    print(f"\nCompared with {baseline.get('commit', '?')} (median ms):")
+    for stage, stats in report["results"].items():
+        previous = baseline.get("results", {}).get(stage)
+        if not previous:
+            print(f"  {stage:<40} {stats['median_ms']:>10.2f}   (new)")
+            continue
+        change = (stats["median_ms"] - previous["median_ms"]) / previous["median_ms"] * 100 if previous["median_ms"] else 0
+        print(f"  {stage:<40} {previous['median_ms']:>10.2f} -> {stats['median_ms']:>10.2f}   {change:+6.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-stage microbenchmarks against local fake Groq/gTTS servers")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--image-sizes", type=int, nargs="+", default=[512, 2048])
+    parser.add_argument("--audio-seconds", type=int, default=90)
+    parser.add_argument("--set", nargs="*", metavar="NAME=VALUE",
+                        help=f"override fake backend latency/payload settings: {', '.join(DEFAULT_CONFIG)}")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare with")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="ai-doctor-bench-") as workdir:
+        args.workdir = workdir
+        report = run(args)
+
+    output = args.output or os.path.join(ROOT, "benchmarks", "results", f"{report['commit']}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as output_file:
+        json.dump(report, output_file, indent=2)
+
+    for stage, stats in report["results"].items():
+        print(f"{stage:<40} median {stats['median_ms']:>10.2f} ms   p95 {stats['p95_ms']:>10.2f} ms")
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as baseline_file:
+            compare(report, json.load(baseline_file))
+
+
+if __name__ == "__main__":
+    main()
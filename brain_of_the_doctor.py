@@ -8,17 +8,32 @@ import os
 GROQ_API_KEY=os.environ.get("GROQ_API_KEY")
 
 #Step2: Convert image to required format
-import base64
+from image_preprocessing import prepare_image, b64encode_capped
 
 
 #image_path="acne.jpg"
 
 def encode_image(image_path):   
-    image_file=open(image_path, "rb")
-    return base64.b64encode(image_file.read()).decode('utf-8')
+    with open(image_path, "rb") as image_file:
+        return b64encode_capped(image_file)
 
 #Step3: Setup Multimodal LLM 
-from groq import Groq
+import response_cache
+import rate_limiter
+import hedging
+from groq_client import get_groq_client
+from singleflight import SingleFlight
+from circuit_breaker import get_breaker
+
+#Identical in-flight questions (same image, query and model) share one API call
+_llm_flights=SingleFlight("llm")
+def _is_bad_request(error):
+    #Rejected requests (bad image, prompt too long) and our own rate-limit queue timing out
+    #say nothing about Groq's health
+    import groq
+    return isinstance(error, groq.BadRequestError) or rate_limiter.is_local_throttle(error)
+
+_llm_breaker=get_breaker("groq_llm", is_ignored=_is_bad_request)
 
 query="Is there something wrong with my face?"
 #model = "meta-llama/llama-4-maverick-17b-128e-instruct"
@@ -26,27 +41,119 @@ model="-llama/metallama-4-scout-17b-16e-instruct"
 #model = "meta-llama/llama-4-scout-17b-16e-instruct"
 #model="llama-3.2-90b-vision-preview" #Deprecated
 
-def analyze_image_with_query(query, model, encoded_image):
-    client=Groq()  
-    messages=[
+def build_messages(query, encoded_image, mime_type="image/jpeg"):
+    #encoded_image may also be a list of images (mime_type then lists their types), all sent in one request
+    content=[
         {
-            "role": "user",
-            "content": [
-                {
-                    "type": "text", 
-                    "text": query
-                },
-                {
-                    "type": "image_url",
-                    "image_url": {
-                        "url": f"data:image/jpeg;base64,{encoded_image}",
-                    },
+            "type": "text", 
+            "text": query
+        }]
+    if encoded_image is not None:
+        encoded_images=[encoded_image] if isinstance(encoded_image, str) else encoded_image
+        mime_types=[mime_type] * len(encoded_images) if isinstance(mime_type, str) else mime_type
+        for image, image_mime_type in zip(encoded_images, mime_types):
+            content.append({
+                "type": "image_url",
+                "image_url": {
+                    "url": f"data:{image_mime_type};base64,{image}",
                 },
-            ],
+            })
+    return [
+        {
+            "role": "user",
+            "content": content,
         }]
-    chat_completion=client.chat.completions.create(
-        messages=messages,
-        model=model
+
+def analyze_image_with_query(query, model, encoded_image, mime_type="image/jpeg"):
+    cache_key=response_cache.make_key(query, model, encoded_image)
+    cached_response=response_cache.get_response(cache_key)
+    if cached_response is not None:
+        return cached_response
+    return _llm_flights.do(cache_key, _answer, cache_key, query, model, encoded_image, mime_type)
+
+def _answer(cache_key, query, model, encoded_image, mime_type):
+    if not hedging.should_hedge(model):
+        return _complete(cache_key, query, model, encoded_image, mime_type)
+    backup_model=hedging.HEDGE_BACKUP_MODEL
+    responses=hedging.hedged_stream(
+        model, lambda: _single(_complete, cache_key, query, model, encoded_image, mime_type),
+        backup_model, lambda: _single(_complete, cache_key, query, backup_model, encoded_image, mime_type),
+        kind="completion"
     )
+    return next(responses)
+
+def _single(function, *args):
+    yield function(*args)
+
+def _complete(cache_key, query, model, encoded_image, mime_type):
+    client=get_groq_client()
+    messages=build_messages(query, encoded_image, mime_type)
+    scheduler=rate_limiter.get_scheduler(model)
+    reserved_tokens=rate_limiter.estimate_chat_tokens(messages)
+    with _llm_breaker.guard() as breaker_call:
+        chat_completion=scheduler.call(
+            client.chat.completions.create,
+            messages=messages,
+            model=model,
+            tokens=reserved_tokens,
+            on_admitted=breaker_call.restart_clock
+        )
+    used_tokens=rate_limiter.usage_tokens(chat_completion)
+    if used_tokens is not None:
+        scheduler.settle(reserved_tokens, used_tokens)
+
+    response=chat_completion.choices[0].message.content
+    response_cache.put_response(cache_key, response)
+    return response
+
+def stream_analyze_image_with_query(query, model, encoded_image, mime_type="image/jpeg"):
+    """Same as analyze_image_with_query, but yields the growing answer as tokens arrive."""
+    cache_key=response_cache.make_key(query, model, encoded_image)
+    cached_response=response_cache.get_response(cache_key)
+    if cached_response is not None:
+        yield cached_response
+        return
+    yield from _llm_flights.stream(
+        "stream:" + cache_key,
+        lambda: _stream_answer(cache_key, query, model, encoded_image, mime_type)
+    )
+
+def _stream_answer(cache_key, query, model, encoded_image, mime_type):
+    if not hedging.should_hedge(model):
+        return _stream_completion(cache_key, query, model, encoded_image, mime_type)
+    backup_model=hedging.HEDGE_BACKUP_MODEL
+    return hedging.hedged_stream(
+        model, lambda: _stream_completion(cache_key, query, model, encoded_image, mime_type),
+        backup_model, lambda: _stream_completion(cache_key, query, backup_model, encoded_image, mime_type)
+    )
+
+def _stream_completion(cache_key, query, model, encoded_image, mime_type):
+    client=get_groq_client()
+    messages=build_messages(query, encoded_image, mime_type)
+    scheduler=rate_limiter.get_scheduler(model)
+    reserved_tokens=rate_limiter.estimate_chat_tokens(messages)
+
+    response=""
+    with _llm_breaker.guard() as breaker_call:
+        stream=scheduler.call(
+            client.chat.completions.create,
+            messages=messages,
+            model=model,
+            stream=True,
+            tokens=reserved_tokens,
+            on_admitted=breaker_call.restart_clock
+        )
+        # Closing the stream (e.g. when a hedged request loses) drops the connection at once
+        with stream:
+            for chunk in stream:
+                used_tokens=rate_limiter.usage_tokens(chunk)
+                if used_tokens is not None:
+                    scheduler.settle(reserved_tokens, used_tokens)
+                if not chunk.choices:
+                    continue
+                token=chunk.choices[0].delta.content
+                if token:
+                    response+=token
+                    yield response
 
-    return chat_completion.choices[0].message.content
+    response_cache.put_response(cache_key, response)
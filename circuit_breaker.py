@@ -0,0 +1,155 @@
+#Circuit breakers for the external backends
+#A breaker trips after repeated errors or calls slower than the backend's latency SLO.
+#While it is open, calls fail at once with CircuitOpenError so process_inputs can answer
+#from the pre-defined conditions, the caches or plain text instead of waiting out a
+#timeout. After BREAKER_RESET_SECONDS one probe call is let through (half-open), and
+#its outcome closes the breaker again or keeps it open.
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+import metrics
+
+BREAKER_FAILURE_THRESHOLD=int(os.environ.get("BREAKER_FAILURE_THRESHOLD", 5))
+BREAKER_RESET_SECONDS=float(os.environ.get("BREAKER_RESET_SECONDS", 30))
+BREAKER_ENABLED=os.environ.get("BREAKER_ENABLED", "1") == "1"
+
+#Latency SLO per backend in seconds; slower calls count as failures
+BREAKER_SLOS={
+    "groq_llm": float(os.environ.get("GROQ_LLM_SLO", 30)),
+    "groq_whisper": float(os.environ.get("GROQ_WHISPER_SLO", 20)),
+    "gtts": float(os.environ.get("TTS_SLO", 15)),
+    "elevenlabs": float(os.environ.get("TTS_SLO", 15)),
+}
+
+CLOSED="closed"
+OPEN="open"
+HALF_OPEN="half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    """The backend's breaker is open, the call was not attempted."""
+
+    def __init__(self, name, retry_in):
+        super().__init__(f"{name} is temporarily unavailable (retry in {retry_in:.0f}s)")
+        self.name = name
+
+
+class _Call:
+    """One guarded call; its latency counts from started_at."""
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+
+    def restart_clock(self):
+        """Start timing now, e.g. once the call leaves the client-side rate-limit queue."""
+        self.started_at = time.monotonic()
+
+
+class CircuitBreaker:
+    """Closed -> open after `failure_threshold` failures in a row -> half-open probe -> closed."""
+
+    def __init__(self, name, slow_call_seconds=None, failure_threshold=BREAKER_FAILURE_THRESHOLD,
+                 reset_seconds=BREAKER_RESET_SECONDS, is_ignored=None):
+        self.name = name
+        self.slow_call_seconds = slow_call_seconds
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.is_ignored = is_ignored
+        self.state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_started_at = None
+        self._lock = threading.Lock()
+
+    def _transition(self, state):
+        self.state = state
+        metrics.inc("circuit_breaker_transitions_total", breaker=self.name, state=state)
+        print(f"Circuit breaker {self.name}: {state}")
+
+    def allow(self):
+        """Whether a call may go out now; every allowed call must be followed by a record_* call.
+
+        A probe that never reports back (its caller went away) is replaced after reset_seconds.
+        """
+        if not BREAKER_ENABLED:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and now - self._opened_at >= self.reset_seconds:
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN and (self._probe_started_at is None
+                                            or now - self._probe_started_at >= self.reset_seconds):
+                self._probe_started_at = now
+                return True
+        metrics.inc("circuit_breaker_rejections_total", breaker=self.name)
+        return False
+
+    def retry_in(self):
+        return max(0.0, self._opened_at + self.reset_seconds - time.monotonic())
+
+    def record_success(self, elapsed):
+        if self.slow_call_seconds and elapsed > self.slow_call_seconds:
+            metrics.inc("circuit_breaker_slow_calls_total", breaker=self.name)
+            self.record_failure()
+            return
+        with self._lock:
+            self._failures = 0
+            self._probe_started_at = None
+            if self.state != CLOSED:
+                self._transition(CLOSED)
+
+    def release(self):
+        """End an allowed call that says nothing about the backend's health (no state change)."""
+        with self._lock:
+            self._probe_started_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probe_started_at = None
+            if self.state == HALF_OPEN or (self.state == CLOSED and self._failures >= self.failure_threshold):
+                self._opened_at = time.monotonic()
+                self._transition(OPEN)
+
+    @contextmanager
+    def guard(self):
+        """Run a block as one call: fail fast while open, record its error or latency otherwise.
+
+        Yields the call, so time spent waiting on our own side can be left out with restart_clock().
+        """
+        if not self.allow():
+            raise CircuitOpenError(self.name, self.retry_in())
+        call = _Call()
+        try:
+            yield call
+        except Exception as e:
+            if self.is_ignored is not None and self.is_ignored(e):
+                self.release()
+            else:
+                self.record_failure()
+            raise
+        self.record_success(time.monotonic() - call.started_at)
+
+    def call(self, function, *args, **kwargs):
+        with self.guard():
+            return function(*args, **kwargs)
+
+
+_breakers = {}
+_lock = threading.Lock()
+
+
+def get_breaker(name, is_ignored=None):
+    """The shared breaker for a backend (groq_llm, groq_whisper, gtts, elevenlabs)."""
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _lock:
+            breaker = _breakers.get(name)
+            if breaker is None:
+                breaker = _breakers[name] = CircuitBreaker(name, BREAKER_SLOS.get(name), is_ignored=is_ignored)
+    return breaker
+
@@ -0,0 +1,368 @@
+#Write-behind consultation store
+#Every consult is recorded (inputs, their hashes, matched condition, model, per-stage
+#timings and the answer) without adding latency to process_inputs: the request path only
+#puts a dict on a bounded in-memory queue, and a background writer batch-inserts the
+#records into an indexed SQLite database in WAL mode, so queries never block the writer.
+#
+#Usage: python consultation_store.py --since 2025-01-01 --condition "Common Cold" --percentile 0.95
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import sqlite3
+import hashlib
+import argparse
+import threading
+from datetime import datetime
+from contextlib import closing
+
+import metrics
+
+CONSULT_STORE_ENABLED=os.environ.get("CONSULT_STORE_ENABLED", "1") == "1"
+CONSULT_STORE_PATH=os.environ.get("CONSULT_STORE_PATH", os.path.join(".cache", "consultations.sqlite3"))
+CONSULT_STORE_QUEUE_SIZE=int(os.environ.get("CONSULT_STORE_QUEUE_SIZE", 1000))
+CONSULT_STORE_BATCH_SIZE=int(os.environ.get("CONSULT_STORE_BATCH_SIZE", 100))
+CONSULT_STORE_FLUSH_INTERVAL=float(os.environ.get("CONSULT_STORE_FLUSH_INTERVAL", 1.0))
+#What a full queue does to a consult: "drop" the record, or "block" up to CONSULT_STORE_BLOCK_TIMEOUT seconds
+CONSULT_STORE_OVERFLOW=os.environ.get("CONSULT_STORE_OVERFLOW", "drop")
+CONSULT_STORE_BLOCK_TIMEOUT=float(os.environ.get("CONSULT_STORE_BLOCK_TIMEOUT", 5.0))
+#Seconds before a writer that failed to start (read-only or locked database) is tried again
+_START_RETRY_SECONDS=60
+
+SCHEMA="""
+CREATE TABLE IF NOT EXISTS consultations (
+    id INTEGER PRIMARY KEY,
+    trace_id TEXT UNIQUE NOT NULL,
+    started_at REAL NOT NULL,
+    total_ms REAL NOT NULL,
+    session TEXT,
+    path TEXT,
+    condition TEXT,
+    model TEXT,
+    symptoms TEXT,
+    transcript TEXT,
+    response TEXT,
+    audio_sha256 TEXT,
+    image_sha256 TEXT,
+    fields TEXT
+);
+CREATE INDEX IF NOT EXISTS consultations_started_at ON consultations (started_at);
+CREATE INDEX IF NOT EXISTS consultations_condition ON consultations (condition, started_at);
+CREATE INDEX IF NOT EXISTS consultations_total_ms ON consultations (total_ms);
+CREATE TABLE IF NOT EXISTS stage_timings (
+    consultation_id INTEGER NOT NULL REFERENCES consultations (id),
+    stage TEXT NOT NULL,
+    ms REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS stage_timings_stage ON stage_timings (stage, ms);
+CREATE INDEX IF NOT EXISTS stage_timings_consultation ON stage_timings (consultation_id);
+"""
+
+_COLUMNS=("trace_id", "started_at", "total_ms", "session", "path", "condition", "model",
+          "symptoms", "transcript", "response", "audio_sha256", "image_sha256", "fields")
+#Trace fields that have their own column
+_COLUMN_FIELDS=("session", "path", "condition", "model")
+
+
+def _file_sha256(path):
+    if not path:
+        return None
+    digest=hashlib.sha256()
+    try:
+        with open(path, "rb") as input_file:
+            for chunk in iter(lambda: input_file.read(1 << 16), b""):
+                digest.update(chunk)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+class ConsultationStore:
+    """Bounded record queue in front of a SQLite database, drained by one writer thread."""
+
+    def __init__(self, path=CONSULT_STORE_PATH, queue_size=CONSULT_STORE_QUEUE_SIZE,
+                 batch_size=CONSULT_STORE_BATCH_SIZE, flush_interval=CONSULT_STORE_FLUSH_INTERVAL,
+                 overflow=CONSULT_STORE_OVERFLOW, block_timeout=CONSULT_STORE_BLOCK_TIMEOUT):
+        if overflow not in ("drop", "block"):
+            raise ValueError("CONSULT_STORE_OVERFLOW must be 'drop' or 'block'")
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._writer = None
+        self._starting = False
+        self._retry_start_at = 0.0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def start(self):
+        with self._lock:
+            if self._writer is None:
+                with closing(self._connect()) as connection:
+                    connection.executescript(SCHEMA)
+                self._writer = threading.Thread(target=self._run, name="consultation-store", daemon=True)
+                self._writer.start()
+                atexit.register(self.close)
+
+    def _start_in_background(self):
+        """Start the writer off the request path (opening the database can wait on a lock); retried after failures."""
+        with self._lock:
+            if self._writer is not None or self._starting or time.monotonic() < self._retry_start_at:
+                return
+            self._starting = True
+
+        def start():
+            try:
+                self.start()
+            except Exception as e:
+                metrics.inc("consult_store_start_errors_total")
+                print(f"Consultation store could not start, retrying in {_START_RETRY_SECONDS}s: {e}")
+                self._retry_start_at = time.monotonic() + _START_RETRY_SECONDS
+            finally:
+                self._starting = False
+
+        threading.Thread(target=start, name="consultation-store-start", daemon=True).start()
+
+    def record(self, record):
+        """Queue one consult record; never raises, and never waits unless the overflow policy is "block"."""
+        try:
+            if self._writer is None:
+                self._start_in_background()
+                if time.monotonic() < self._retry_start_at:
+                    # The store failed to open; queued records would only pile up until the retry
+                    metrics.inc("consult_store_dropped_total", reason="unavailable")
+                    return False
+            # Without a running writer nothing drains the queue, so blocking on it would only stall the consult
+            if self.overflow == "block" and self._writer is not None:
+                self._queue.put(record, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(record)
+        except queue.Full:
+            metrics.inc("consult_store_dropped_total", reason="queue_full")
+            return False
+        except Exception as e:
+            # Analytics must never fail a consult
+            metrics.inc("consult_store_dropped_total", reason="error")
+            print(f"Consult record dropped: {e}")
+            return False
+        metrics.set_gauge("consult_store_queue_depth", self._queue.qsize())
+        return True
+
+    def _run(self):
+        connection = self._connect()
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and batch[-1] is not None:
+                try:
+                    batch.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            stop = batch[-1] is None
+            records = [record for record in batch if record is not None]
+            if records:
+                try:
+                    self._write(connection, records)
+                except Exception as e:
+                    metrics.inc("consult_store_write_errors_total", error=type(e).__name__)
+                    print(f"Consultation store write failed: {e}")
+            for _ in batch:
+                self._queue.task_done()
+            metrics.set_gauge("consult_store_queue_depth", self._queue.qsize())
+            if stop:
+                connection.close()
+                return
+
+    def _write(self, connection, records):
+        started_at = time.perf_counter()
+        rows = []
+        for record in records:
+            fields = dict(record["fields"])
+            row = {name: fields.pop(name, None) for name in _COLUMN_FIELDS}
+            row.update(
+                trace_id=record["trace_id"],
+                started_at=record["started_at"],
+                total_ms=record["total_ms"],
+                symptoms=json.dumps(record.get("symptoms") or [], ensure_ascii=False),
+                transcript=record.get("transcript"),
+                response=record.get("response"),
+                # Hashed here rather than on the request path
+                audio_sha256=_file_sha256(record.get("audio_path")),
+                image_sha256=",".join(filter(None, map(_file_sha256, record.get("image_paths") or []))) or None,
+                fields=json.dumps(fields, ensure_ascii=False, default=str),
+            )
+            rows.append((row, record["stage_timings"]))
+
+        with connection:
+            for row, stage_timings in rows:
+                cursor = connection.execute(
+                    f"INSERT OR IGNORE INTO consultations ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})",
+                    [row[name] for name in _COLUMNS]
+                )
+                if cursor.rowcount:
+                    connection.executemany(
+                        "INSERT INTO stage_timings (consultation_id, stage, ms) VALUES (?, ?, ?)",
+                        [(cursor.lastrowid, stage, ms) for stage, ms in stage_timings.items()]
+                    )
+        metrics.inc("consult_store_written_total", len(rows))
+        metrics.observe("consult_store_batch_seconds", time.perf_counter() - started_at)
+
+    def flush(self):
+        """Block until every queued record has been written."""
+        if self._writer is None and not self._queue.empty():
+            self.start()
+        self._queue.join()
+
+    def close(self):
+        with self._lock:
+            if self._writer is None:
+                return
+            self._queue.put(None)
+            self._writer.join()
+            self._writer = None
+
+    # Queries run on their own connection; WAL lets them read while the writer inserts
+
+    def consultations(self, since=None, until=None, condition=None, min_total_ms=None, limit=100):
+        """Consults, newest first, filtered by start time range, matched condition and total latency."""
+        return self._select(since, until, condition, min_total_ms, "started_at DESC", limit)
+
+    def latency_percentile(self, fraction, stage=None, since=None, until=None, condition=None):
+        """Total (or one stage's) latency in ms at the given percentile, e.g. 0.95, or None without data."""
+        clauses, params = _filters(since, until, condition)
+        if stage is None:
+            table, column = "consultations", "total_ms"
+        else:
+            table = "stage_timings JOIN consultations ON consultations.id = stage_timings.consultation_id"
+            column = "stage_timings.ms"
+            clauses.append("stage = ?")
+            params.append(stage)
+        where = _where(clauses)
+        with closing(self._connect()) as connection:
+            count = connection.execute(f"SELECT COUNT(*) FROM {table}{where}", params).fetchone()[0]
+            if not count:
+                return None
+            offset = min(count - 1, int(count * fraction))
+            return connection.execute(
+                f"SELECT {column} FROM {table}{where} ORDER BY {column} LIMIT 1 OFFSET ?", params + [offset]
+            ).fetchone()[0]
+
+    def slowest(self, fraction, since=None, until=None, condition=None, limit=100):
+        """Consults at or above the given total-latency percentile, slowest first."""
+        threshold = self.latency_percentile(fraction, since=since, until=until, condition=condition)
+        if threshold is None:
+            return []
+        return self._select(since, until, condition, threshold, "total_ms DESC", limit)
+
+    def _select(self, since, until, condition, min_total_ms, order_by, limit):
+        clauses, params = _filters(since, until, condition)
+        if min_total_ms is not None:
+            clauses.append("total_ms >= ?")
+            params.append(min_total_ms)
+        with closing(self._connect()) as connection:
+            rows = connection.execute(
+                f"SELECT * FROM consultations{_where(clauses)} ORDER BY {order_by} LIMIT ?", params + [limit]
+            ).fetchall()
+            return [self._as_dict(connection, row) for row in rows]
+
+    @staticmethod
+    def _as_dict(connection, row):
+        consult = dict(row)
+        consult["symptoms"] = json.loads(consult["symptoms"] or "[]")
+        consult["fields"] = json.loads(consult["fields"] or "{}")
+        consult["stage_timings"] = dict(connection.execute(
+            "SELECT stage, ms FROM stage_timings WHERE consultation_id = ?", (consult["id"],)
+        ).fetchall())
+        return consult
+
+
+def _filters(since, until, condition):
+    clauses, params = [], []
+    if since is not None:
+        clauses.append("started_at >= ?")
+        params.append(since)
+    if until is not None:
+        clauses.append("started_at < ?")
+        params.append(until)
+    if condition is not None:
+        clauses.append("condition = ?")
+        params.append(condition)
+    return clauses, params
+
+
+def _where(clauses):
+    return " WHERE " + " AND ".join(clauses) if clauses else ""
+
+
+_store = ConsultationStore()
+
+
+def record_consult(trace, audio_filepath, image_filepaths, selected_symptoms, outputs):
+    """Queue the record of a finished consult (outputs is its last (transcript, answer, voice) update)."""
+    if not CONSULT_STORE_ENABLED:
+        return
+    transcript, response, _ = outputs or (None, None, None)
+    _store.record({
+        "trace_id": trace.trace_id,
+        "started_at": trace.started_at,
+        "total_ms": round((time.time() - trace.started_at) * 1000, 2),
+        "fields": dict(trace.fields),
+        "stage_timings": trace.stage_timings(),
+        "symptoms": list(selected_symptoms or []),
+        "transcript": transcript,
+        "response": response,
+        "audio_path": audio_filepath,
+        "image_paths": list(image_filepaths or []),
+    })
+
+
+def get_store():
+    return _store
+
+
+def _timestamp(value):
+    return datetime.fromisoformat(value).timestamp() if value else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the consultation store")
+    parser.add_argument("--since", help="ISO date or time, e.g. 2025-01-31 or 2025-01-31T08:00")
+    parser.add_argument("--until", help="ISO date or time (exclusive)")
+    parser.add_argument("--condition", help="matched pre-defined condition")
+    parser.add_argument("--percentile", type=float, help="only consults at or above this total-latency percentile, e.g. 0.95")
+    parser.add_argument("--stage", help="with --percentile, print that stage's latency percentile instead")
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    since, until = _timestamp(args.since), _timestamp(args.until)
+    if args.stage:
+        latency = _store.latency_percentile(args.percentile or 0.5, stage=args.stage, since=since, until=until,
+                                            condition=args.condition)
+        print(f"{args.stage} p{(args.percentile or 0.5) * 100:g}: {latency} ms")
+        return 0
+    if args.percentile is not None:
+        consults = _store.slowest(args.percentile, since=since, until=until, condition=args.condition, limit=args.limit)
+    else:
+        consults = _store.consultations(since=since, until=until, condition=args.condition, limit=args.limit)
+    for consult in consults:
+        started_at = datetime.fromtimestamp(consult["started_at"]).isoformat(timespec="seconds")
+        print(json.dumps({"started_at": started_at, **{key: consult[key] for key in
+                          ("trace_id", "total_ms", "path", "condition", "model", "stage_timings")}}, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
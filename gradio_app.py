@@ -4,114 +4,48 @@
 
 #VoiceBot UI with Gradio
 import os
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
 import gradio as gr
 
-from brain_of_the_doctor import encode_image, analyze_image_with_query
-from voice_of_the_patient import record_audio, transcribe_with_groq
-from voice_of_the_doctor import text_to_speech_with_gtts, text_to_speech_with_elevenlabs
+from brain_of_the_doctor import prepare_image, stream_analyze_image_with_query
+from image_preprocessing import unique_images
+from voice_of_the_patient import transcribe_with_groq
+from voice_of_the_doctor import text_to_speech_with_gtts, text_to_speech_with_elevenlabs, stream_text_to_speech, prerender_speech
+from groq_client import get_groq_client
+import metrics
+from circuit_breaker import CircuitOpenError
+from symptom_matcher import clean_symptom_names
+from similarity_cache import get_similar_response, put_similar_response
+import triage
+import knowledge_base
+import consultation_store
+from artifact_store import ARTIFACT_DIR, new_artifact_path, atomic_output, start_garbage_collector
 
 #load_dotenv()
 
 # PRE-DEFINED SYMPTOM SOLUTIONS DATABASE (ZERO API COST)
-SYMPTOM_SOLUTIONS = {
-    # Fever & Cold Patterns
-    "fever_cold": {
-        "symptoms": ["Fever", "Cough/Cold", "Chills", "Fatigue"],
-        "condition": "Common Cold or Viral Infection",
-        "advice": "Rest, drink plenty of fluids, and take over-the-counter fever reducers like acetaminophen. Monitor your temperature and see a doctor if fever persists beyond 3 days.",
-        "urgency": "Moderate - See doctor if no improvement in 3 days"
-    },
-    
-    "flu": {
-        "symptoms": ["Fever", "Muscle Pain", "Chills", "Fatigue", "Headache"],
-        "condition": "Influenza (Flu)",
-        "advice": "Get plenty of rest, stay hydrated, and consider antiviral medication if diagnosed early. Isolate to prevent spreading.",
-        "urgency": "Moderate - Consult doctor within 24-48 hours"
-    },
-    
-    # Pain Patterns
-    "migraine": {
-        "symptoms": ["Headache", "Vision Problems", "Nausea"],
-        "condition": "Migraine Headache",
-        "advice": "Rest in a dark, quiet room. Apply cold compress to forehead. Stay hydrated and avoid triggers like bright lights or strong smells.",
-        "urgency": "Moderate - See doctor for recurring migraines"
-    },
-    
-    "arthritis": {
-        "symptoms": ["Joint Pain", "Muscle Pain"],
-        "condition": "Arthritis or Joint Inflammation",
-        "advice": "Apply ice packs to affected joints, avoid strenuous activities. Consider over-the-counter anti-inflammatory medication. Gentle stretching may help.",
-        "urgency": "Low - Schedule doctor appointment"
-    },
-    
-    "muscle_strain": {
-        "symptoms": ["Muscle Pain", "Fatigue"],
-        "condition": "Muscle Strain or Overuse",
-        "advice": "Rest the affected area, apply ice for 20 minutes several times daily. Gentle stretching after 48 hours. Avoid activities that cause pain.",
-        "urgency": "Low - Self-care for 3-5 days"
-    },
-    
-    # Respiratory Patterns
-    "allergies": {
-        "symptoms": ["Cough/Cold", "Fatigue"],
-        "condition": "Seasonal Allergies",
-        "advice": "Avoid allergens, use over-the-counter antihistamines. Keep windows closed during high pollen days. Consider air purifier.",
-        "urgency": "Low - Try OTC allergy medication first"
-    },
-    
-    # General Illness
-    "fatigue_syndrome": {
-        "symptoms": ["Fatigue", "Sleep Issues", "Appetite Loss"],
-        "condition": "Fatigue or Stress-Related Condition",
-        "advice": "Ensure 7-8 hours of sleep nightly, maintain regular sleep schedule. Eat balanced meals and stay hydrated. Reduce stress through relaxation techniques.",
-        "urgency": "Low - Lifestyle changes recommended"
-    },
-    
-    "dehydration": {
-        "symptoms": ["Fatigue", "Dizziness", "Headache"],
-        "condition": "Possible Dehydration",
-        "advice": "Drink water consistently throughout the day. Include electrolyte solutions if sweating heavily. Avoid caffeine and alcohol.",
-        "urgency": "Low - Increase fluid intake immediately"
-    },
-    
-    "stomach_issues": {
-        "symptoms": ["Nausea", "Appetite Loss", "Fatigue"],
-        "condition": "Stomach Bug or Indigestion",
-        "advice": "Stick to bland foods (BRAT diet: bananas, rice, applesauce, toast). Stay hydrated with small sips of water. Avoid spicy or fatty foods.",
-        "urgency": "Low - See doctor if symptoms persist 48+ hours"
-    }
-}
-
+# Loaded from conditions.json (CONDITIONS_PATH) and hot-reloaded when the file changes
 def detect_condition_from_symptoms(selected_symptoms):
     """Match symptoms against pre-defined conditions without API calls"""
     if not selected_symptoms:
         return None
-    
-    # Clean symptom names (remove emojis)
-    clean_symptoms = []
-    for symptom in selected_symptoms:
-        if ' ' in symptom:
-            clean_symptoms.append(symptom.split(' ', 1)[1])
-        else:
-            clean_symptoms.append(symptom)
-    
-    symptom_set = set(clean_symptoms)
-    
-    best_match = None
-    highest_match_count = 0
-    
-    # Find the best matching condition
-    for condition_id, condition_data in SYMPTOM_SOLUTIONS.items():
-        condition_symptoms = set(condition_data["symptoms"])
-        matching_symptoms = symptom_set.intersection(condition_symptoms)
-        match_count = len(matching_symptoms)
-        
-        # Require at least 2 matching symptoms for a valid match
-        if match_count >= 2 and match_count > highest_match_count:
-            highest_match_count = match_count
-            best_match = condition_data
-    
-    return best_match
+    return knowledge_base.current().matcher.best_match(clean_symptom_names(selected_symptoms))
+
+def format_predefined_response(solution):
+    """Doctor's answer for a pre-defined condition match"""
+    return f"""🚨 QUICK DETECTION: {solution['condition']}
+
+📋 SYMPTOMS MATCHED: {', '.join(solution['symptoms'])}
+
+💡 RECOMMENDATIONS: {solution['advice']}
+
+⚠️ URGENCY: {solution['urgency']}
+
+Note: This is automated advice. Consult healthcare provider for proper diagnosis."""
 
 system_prompt="""You have to act as a professional doctor, i know you are not but this is for learning purpose. 
             What's in this image?. Do you find anything wrong with it medically? 
@@ -121,92 +55,486 @@ system_prompt="""You have to act as a professional doctor, i know you are not bu
             Dont respond as an AI model in markdown, your answer should mimic that of an actual doctor not an AI bot, 
             Keep your answer concise (max 2 sentences). No preamble, start your answer right away please"""
 
+multi_image_prompt=""" The {count} images show the same problem from different angles, consider them together
+            and give a single answer."""
+
+
+# Per-stage deadlines in seconds (defaults for the UI sliders)
+STAGE_DEADLINES = {
+    "transcription": float(os.environ.get("TRANSCRIPTION_DEADLINE", 30)),
+    "image": float(os.environ.get("IMAGE_DEADLINE", 15)),
+    "llm": float(os.environ.get("LLM_DEADLINE", 60)),
+    "tts": float(os.environ.get("TTS_DEADLINE", 30)),
+}
+
+# Voice settings: TTS_BACKEND picks gtts or elevenlabs, PROGRESSIVE_TTS=1 streams the
+# answer sentence by sentence so the first one plays while the rest are rendered
+TTS_BACKEND = os.environ.get("TTS_BACKEND", "gtts")
+PROGRESSIVE_TTS = os.environ.get("PROGRESSIVE_TTS", "0") == "1"
+TTS_FUNCTIONS = {
+    "gtts": text_to_speech_with_gtts,
+    "elevenlabs": text_to_speech_with_elevenlabs,
+}
+
+# TTS_WARMUP=1 pre-renders the voice of every pre-defined answer at startup
+TTS_WARMUP = os.environ.get("TTS_WARMUP", "0") == "1"
+
+
+def prerender_predefined_responses():
+    """Fill the TTS cache with every pre-defined answer, so matches never hit the network"""
+    solutions = knowledge_base.current().solutions
+    for condition_id, condition_data in solutions.items():
+        try:
+            prerender_speech(
+                format_predefined_response(condition_data),
+                backend=TTS_BACKEND,
+                chunked=PROGRESSIVE_TTS
+            )
+        except Exception as e:
+            print(f"TTS warm-up failed for {condition_id}: {e}")
+    try:
+        prerender_speech(triage.EMERGENCY_ADVICE, backend=TTS_BACKEND, chunked=PROGRESSIVE_TTS)
+    except Exception as e:
+        print(f"TTS warm-up failed for the emergency advice: {e}")
+    print(f"✅ Pre-rendered voice for {len(solutions)} pre-defined conditions")
+
+# Consults Gradio runs at the same time, including those waiting for admission
+# (triage.QUICK_CONCURRENCY and triage.IMAGE_CONCURRENCY limit the actual work)
+CONSULT_CONCURRENCY = int(os.environ.get("CONSULT_CONCURRENCY", 32))
+
+BUSY_RESPONSE = (
+    "The service is busy right now, please try again in a few minutes. "
+    "If your symptoms are severe or getting worse, contact a healthcare provider."
+)
+
+# Worker pools so independent stages of one consult run at the same time. Transcriptions
+# can sit in the Whisper rate-limit queue and voice renders wait on their backend, so each
+# has its own pool and cannot take the threads image encoding needs (or each other's)
+stage_pool = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("STAGE_WORKERS", 16)),
+    thread_name_prefix="consult-stage"
+)
+transcription_stage_pool = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("TRANSCRIPTION_STAGE_WORKERS", 8)),
+    thread_name_prefix="consult-transcription"
+)
+voice_stage_pool = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("VOICE_STAGE_WORKERS", 8)),
+    thread_name_prefix="consult-voice"
+)
+
+
+class StageClock:
+    """When a submitted stage was picked up by a worker thread; its deadline counts from there, not from the queue"""
+
+    def __init__(self):
+        self._started = threading.Event()
+        self.started_at = None
+
+    def start(self):
+        self.started_at = time.monotonic()
+        self._started.set()
+
+    def expires_at(self, future, deadline):
+        # Blocks while the stage is still queued; a stage cancelled before it ran has no time left
+        while not self._started.wait(0.1):
+            if future.done():
+                return time.monotonic()
+        return self.started_at + deadline
+
+
+def submit_stage(pool, function, *args, **kwargs):
+    """pool.submit, with a StageClock on the returned future"""
+    clock = StageClock()
+
+    def run():
+        clock.start()
+        return function(*args, **kwargs)
+
+    future = pool.submit(run)
+    future.clock = clock
+    return future
+
+
+def wait_for_stage(future, deadline, stage_name):
+    """Wait for a stage result, raising TimeoutError once its deadline has passed"""
+    try:
+        return future.result(timeout=max(future.clock.expires_at(future, deadline) - time.monotonic(), 0))
+    except FuturesTimeoutError:
+        future.cancel()
+        raise TimeoutError(f"{stage_name} exceeded its {deadline:g}s deadline")
+
+
+def wait_for_stages(futures, deadline, stage_name):
+    """Wait for parallel runs of one stage, each within the deadline from its own start; results in submission order"""
+    try:
+        return [wait_for_stage(future, deadline, stage_name) for future in futures]
+    except TimeoutError:
+        for future in futures:
+            future.cancel()
+        raise
+
+
+def stream_with_deadline(chunks, deadline, stage_name):
+    """Re-yield a streaming stage from a thread of its own, raising TimeoutError past its deadline"""
+    items = queue.Queue()
+    finished = object()
+    abandoned = threading.Event()
+
+    def pump():
+        try:
+            for chunk in chunks:
+                if abandoned.is_set():
+                    chunks.close()
+                    return
+                items.put(chunk)
+            items.put(finished)
+        except Exception as e:
+            items.put(e)
+
+    # A dedicated thread starts at once, so the deadline below only covers the stage itself
+    threading.Thread(target=pump, name=f"consult-stream-{stage_name}", daemon=True).start()
+    expires_at = time.monotonic() + deadline
+    try:
+        while True:
+            try:
+                item = items.get(timeout=max(expires_at - time.monotonic(), 0))
+            except queue.Empty:
+                raise TimeoutError(f"{stage_name} exceeded its {deadline:g}s deadline")
+            if item is finished:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        abandoned.set()
+
+
+LLM_UNAVAILABLE_RESPONSE = (
+    "The image analysis service is temporarily unavailable, please try again in a few minutes. "
+    "If your symptoms are severe or getting worse, contact a healthcare provider."
+)
+IMAGE_UNAVAILABLE_NOTICE = "⚠️ Image analysis is unavailable right now, this answer is based on your selected symptoms only."
+TRANSCRIPTION_UNAVAILABLE_NOTICE = "(Voice transcription is temporarily unavailable, please select your symptoms instead.)"
+SYMPTOM_FALLBACK_ADVICE = "I recommend consulting a healthcare provider for proper diagnosis."
+
+
+def degraded_response(error, predefined_solution, error_prefix):
+    """Answer to show when the LLM failed or its circuit breaker is open"""
+    if predefined_solution:
+        return (IMAGE_UNAVAILABLE_NOTICE + "\n\n"
+                + format_predefined_response(predefined_solution))
+    if isinstance(error, CircuitOpenError):
+        return LLM_UNAVAILABLE_RESPONSE
+    return f"{error_prefix}: {str(error)}"
+
+
+def record_error(trace, stage, error):
+    """Note a failed stage on the consult's trace (the answer itself falls back and carries on)"""
+    trace.fields.setdefault("errors", []).append(f"{stage}: {type(error).__name__}: {error}")
+
+
+BUSY_ERROR = "busy: no admission slot (too many waiting, or the admission timeout passed)"
+DEGRADED_ERROR = "degraded: a backend circuit breaker is open"
+
+
+def consult_error(trace):
+    """Why a finished consult fell short of a full answer (busy, failed stage, open breaker), or None"""
+    if trace.fields.get("path") == "busy":
+        return BUSY_ERROR
+    if trace.fields.get("errors"):
+        return "; ".join(trace.fields["errors"])
+    if trace.fields.get("degraded"):
+        return DEGRADED_ERROR
+    return None
+
+
+def answer_error(outputs):
+    """consult_error's verdict read from a consult's final (transcript, answer, voice), for API clients without the trace"""
+    transcript, response, voice = outputs or (None, None, None)
+    transcript, response = transcript or "", response or ""
+    if BUSY_RESPONSE in response:
+        return BUSY_ERROR
+    errors = []
+    if "Error transcribing audio:" in transcript:
+        errors.append("transcription: failed")
+    if "Error analyzing image:" in response:
+        errors.append("image_analysis: failed")
+    if "Based on your symptoms:" in response and response.endswith(SYMPTOM_FALLBACK_ADVICE):
+        errors.append("symptom_analysis: failed")
+    if not voice:
+        errors.append("tts: no voice")
+    if errors:
+        return "; ".join(errors)
+    if (TRANSCRIPTION_UNAVAILABLE_NOTICE in transcript or LLM_UNAVAILABLE_RESPONSE in response
+            or IMAGE_UNAVAILABLE_NOTICE in response):
+        return DEGRADED_ERROR
+    return None
+
+
+def write_voice_artifact(input_text, session_id=None):
+    """Render the doctor's voice into a new, atomically written file of this session"""
+    voice_filepath = new_artifact_path(session_id, suffix=".mp3")
+    with atomic_output(voice_filepath) as tmp_filepath:
+        if TTS_FUNCTIONS[TTS_BACKEND](input_text=input_text, output_filepath=tmp_filepath) is None:
+            raise RuntimeError(f"{TTS_BACKEND} could not render the response")
+    return voice_filepath
+
+
+def process_inputs(audio_filepath, image_filepaths, selected_symptoms=None,
+                   transcription_deadline=STAGE_DEADLINES["transcription"],
+                   image_deadline=STAGE_DEADLINES["image"],
+                   llm_deadline=STAGE_DEADLINES["llm"],
+                   tts_deadline=STAGE_DEADLINES["tts"],
+                   request: gr.Request = None, trace=None):
+    # Generator: every yield updates (symptoms summary, doctor's answer, voice) in the UI,
+    # so the answer fills in token by token instead of appearing all at once.
+    # Callers outside the UI can pass their own trace and check consult_error(trace) afterwards.
+    session_id = request.session_hash if request else None
+    # One path (API and batch callers) or the list from the multi-file upload
+    if isinstance(image_filepaths, str):
+        image_filepaths = [image_filepaths]
+    image_filepaths = list(image_filepaths or [])
+    if trace is None:
+        trace = metrics.RequestTrace()
+    trace.fields.update(session=session_id, has_audio=bool(audio_filepath), has_image=bool(image_filepaths))
+    metrics.inc("consults_total")
+    outputs = None
+    try:
+        for outputs in run_consult(audio_filepath, image_filepaths, selected_symptoms,
+                                   transcription_deadline, image_deadline, llm_deadline, tts_deadline,
+                                   session_id, trace):
+            yield outputs
+    finally:
+        trace.finish()
+        # Only queued here, the store writes in the background
+        consultation_store.record_consult(trace, audio_filepath, image_filepaths, selected_symptoms, outputs)
+
+
+def run_consult(audio_filepath, image_filepaths, selected_symptoms,
+                transcription_deadline, image_deadline, llm_deadline, tts_deadline,
+                session_id, trace):
+    # Step 0: Start the independent stages right away - transcription and image
+    # encoding overlap, so the consult costs the slowest stage instead of the sum
+    transcription_future = None
+    if audio_filepath:
+        metrics.inc("payload_bytes_total", os.path.getsize(audio_filepath), direction="in", kind="audio")
+        transcription_future = submit_stage(
+            transcription_stage_pool,
+            metrics.timed("transcription", transcribe_with_groq, trace),
+            GROQ_API_KEY=os.environ.get("GROQ_API_KEY"), 
+            audio_filepath=audio_filepath,
+            stt_model="whisper-large-v3"
+        )
+    # Duplicate uploads are sent once, the others are preprocessed in parallel
+    image_filepaths = unique_images(image_filepaths)
+    if image_filepaths:
+        trace.fields["images"] = len(image_filepaths)
+    image_futures = []
+    for image_filepath in image_filepaths:
+        metrics.inc("payload_bytes_total", os.path.getsize(image_filepath), direction="in", kind="image")
+        image_futures.append(submit_stage(stage_pool, metrics.timed("image_encoding", prepare_image, trace), image_filepath))
 
-def process_inputs(audio_filepath, image_filepath, selected_symptoms=None):
     # Step 1: Try pre-defined solutions first (NO API CALLS)
+    # Sorted so the same selection always builds the same question, whatever the click order
+    clean_symptoms = sorted(set(clean_symptom_names(selected_symptoms)))
     predefined_solution = None
-    if selected_symptoms:
-        predefined_solution = detect_condition_from_symptoms(selected_symptoms)
+    if clean_symptoms:
+        with metrics.span("predefined_match", trace):
+            predefined_solution = knowledge_base.current().matcher.best_match(clean_symptoms)
     
     # Build symptom text
     symptom_text = ""
-    if selected_symptoms:
-        clean_symptoms = []
-        for symptom in selected_symptoms:
-            if ' ' in symptom:
-                clean_symptoms.append(symptom.split(' ', 1)[1])
-            else:
-                clean_symptoms.append(symptom)
+    if clean_symptoms:
         symptom_text = "Patient reports symptoms: " + ", ".join(clean_symptoms) + ". "
         print(f"✅ Using selected symptoms: {symptom_text}")
     
-    speech_to_text_output = ""
-    
+    speech_to_text_output = symptom_text if symptom_text else "No symptoms described"
+    transcript_ok = True
+
+    # Selected symptoms are triaged before the transcript is in, so an emergency never waits on Whisper
+    red_flags = triage.find_red_flags(symptom_text)
+    if transcription_future and triage.is_urgent(red_flags):
+        transcription_future.cancel()
     # Handle audio input
-    if audio_filepath:
+    elif transcription_future:
+        yield symptom_text, "", None
         try:
-            transcribed_text = transcribe_with_groq(
-                GROQ_API_KEY=os.environ.get("GROQ_API_KEY"), 
-                audio_filepath=audio_filepath,
-                stt_model="whisper-large-v3"
-            )
+            transcribed_text = wait_for_stage(transcription_future, transcription_deadline, "Transcription")
             speech_to_text_output = symptom_text + transcribed_text
+        except CircuitOpenError as e:
+            trace.fields["degraded"] = True
+            record_error(trace, "transcription", e)
+            transcript_ok = False
+            speech_to_text_output = symptom_text + TRANSCRIPTION_UNAVAILABLE_NOTICE
         except Exception as e:
+            metrics.inc("api_errors_total", backend="groq_whisper", error=type(e).__name__)
+            record_error(trace, "transcription", e)
+            transcript_ok = False
             speech_to_text_output = symptom_text + f"Error transcribing audio: {str(e)}"
-    else:
-        speech_to_text_output = symptom_text if symptom_text else "No symptoms described"
-    
-    # Step 2: Use pre-defined solution if available (SAVES API CALLS)
-    if predefined_solution and not image_filepath:
-        doctor_response = f"""🚨 QUICK DETECTION: {predefined_solution['condition']}
+        red_flags = triage.find_red_flags(speech_to_text_output)
+
+    # Red flags skip the queue: a local emergency answer right away, no slot and no LLM call
+    if triage.is_urgent(red_flags):
+        for image_future in image_futures:
+            image_future.cancel()
+        metrics.inc("red_flag_consults_total")
+        trace.fields["path"] = "emergency"
+        trace.fields["red_flags"] = red_flags
+        doctor_response = triage.emergency_response(red_flags)
+        yield speech_to_text_output, doctor_response, None
+        yield from speak(speech_to_text_output, doctor_response, triage.EMERGENCY_ADVICE,
+                         tts_deadline, session_id, trace)
+        return
 
-📋 SYMPTOMS MATCHED: {', '.join(predefined_solution['symptoms'])}
+    # Soft red flags only ("I fainted once"): the normal answer, with a caution on top
+    caution = ""
+    if red_flags:
+        metrics.inc("caution_consults_total")
+        trace.fields["red_flags"] = red_flags
+        caution = triage.caution_notice(red_flags)
 
-💡 RECOMMENDATIONS: {predefined_solution['advice']}
+    # Everything else waits for a slot of its class, so image jobs cannot starve quick lookups
+    priority = triage.priority_class(image_filepaths)
+    trace.fields["priority"] = priority
+    if not triage.admission.try_acquire(priority):
+        yield speech_to_text_output, "⏳ Many consultations are in progress, yours will start shortly...", None
+        with metrics.span("admission_wait", trace):
+            admitted = triage.admission.acquire(priority)
+        if not admitted:
+            trace.fields["path"] = "busy"
+            yield speech_to_text_output, BUSY_RESPONSE, None
+            return
+    try:
+        yield from answer_consult(speech_to_text_output, transcript_ok, predefined_solution,
+                                  image_filepaths, image_futures, image_deadline, llm_deadline, tts_deadline,
+                                  session_id, trace, caution)
+    finally:
+        triage.admission.release(priority)
 
-⚠️ URGENCY: {predefined_solution['urgency']}
 
-Note: This is automated advice. Consult healthcare provider for proper diagnosis."""
+def answer_consult(speech_to_text_output, transcript_ok, predefined_solution,
+                   image_filepaths, image_futures, image_deadline, llm_deadline, tts_deadline,
+                   session_id, trace, caution=""):
+    # Step 2: Use pre-defined solution if available (SAVES API CALLS)
+    if predefined_solution and not image_filepaths:
+        doctor_response = format_predefined_response(predefined_solution)
+        metrics.inc("fast_path_hits_total")
+        trace.fields["path"] = "predefined"
+        trace.fields["condition"] = predefined_solution["condition"]
         
         print("✅ Used pre-defined solution - Zero API cost!")
     
     # Step 3: Use AI for complex cases or with images
-    elif image_filepath:
+    elif image_filepaths:
+        doctor_response = ""
+        image_model = "meta-llama/llama-4-scout-17b-16e-instruct"
+        trace.fields["path"] = "image"
+        trace.fields["model"] = image_model
         try:
-            doctor_response = analyze_image_with_query(
-                query=system_prompt + (" " + speech_to_text_output if speech_to_text_output else ""), 
-                encoded_image=encode_image(image_filepath), 
-                model="meta-llama/llama-4-scout-17b-16e-instruct"
+            images = wait_for_stages(image_futures, image_deadline, "Image encoding")
+            encoded_images = [encoded_image for encoded_image, _ in images]
+            metrics.inc("payload_bytes_total", sum(map(len, encoded_images)), direction="out", kind="llm_image")
+            # All images go in one request with one shared prompt
+            image_prompt = system_prompt
+            if len(images) > 1:
+                image_prompt += multi_image_prompt.format(count=len(images))
+            partial_responses = stream_analyze_image_with_query(
+                query=image_prompt + (" " + speech_to_text_output if speech_to_text_output else ""), 
+                encoded_image=encoded_images, 
+                mime_type=[image_mime_type for _, image_mime_type in images],
+                model=image_model
             )
+            with metrics.span("llm", trace):
+                for doctor_response in stream_with_deadline(partial_responses, llm_deadline, "Image analysis"):
+                    yield speech_to_text_output, caution + doctor_response, None
         except Exception as e:
-            doctor_response = f"Error analyzing image: {str(e)}"
+            # Open breaker or failed call: fall back to the symptom match, else a plain-text answer
+            if isinstance(e, CircuitOpenError):
+                trace.fields["degraded"] = True
+            else:
+                metrics.inc("api_errors_total", backend="groq_llm", error=type(e).__name__)
+            record_error(trace, "image_analysis", e)
+            doctor_response = degraded_response(e, predefined_solution, "Error analyzing image")
     
     else:
         # Fallback to AI for symptoms without pre-defined match
-        try:
-            symptom_prompt = """You are a medical doctor for educational purposes. The patient reports: {symptoms}
+        trace.fields["path"] = "llm_symptoms"
+        symptom_model = "meta-llama/llama-4-scout-17b-16e-instruct"
+        trace.fields["model"] = symptom_model
+        # Near-identical descriptions (reworded transcripts) reuse an earlier answer
+        similar = None
+        if transcript_ok:
+            with metrics.span("similarity_lookup", trace):
+                similar = get_similar_response(speech_to_text_output, symptom_model)
+        if similar:
+            doctor_response, similarity = similar
+            trace.fields["path"] = "similar_symptoms"
+            trace.fields["similarity"] = round(similarity, 3)
+            print(f"✅ Reused the answer to a similar description (similarity {similarity:.2f}) - Zero API cost!")
+        else:
+            try:
+                symptom_prompt = """You are a medical doctor for educational purposes. The patient reports: {symptoms}
             
             Provide brief possible causes and self-care advice in 2-3 sentences. Be concise and practical."""
             
-            doctor_response = analyze_image_with_query(
-                query=symptom_prompt.format(symptoms=speech_to_text_output), 
-                encoded_image=None,
-                model="meta-llama/llama-4-scout-17b-16e-instruct"
-            )
-        except Exception as e:
-            doctor_response = f"Based on your symptoms: {speech_to_text_output}. I recommend consulting a healthcare provider for proper diagnosis."
+                partial_responses = stream_analyze_image_with_query(
+                    query=symptom_prompt.format(symptoms=speech_to_text_output), 
+                    encoded_image=None,
+                    model=symptom_model
+                )
+                doctor_response = ""
+                with metrics.span("llm", trace):
+                    for doctor_response in stream_with_deadline(partial_responses, llm_deadline, "Symptom analysis"):
+                        yield speech_to_text_output, caution + doctor_response, None
+                if transcript_ok:
+                    put_similar_response(speech_to_text_output, symptom_model, doctor_response)
+            except Exception as e:
+                if isinstance(e, CircuitOpenError):
+                    trace.fields["degraded"] = True
+                else:
+                    metrics.inc("api_errors_total", backend="groq_llm", error=type(e).__name__)
+                record_error(trace, "symptom_analysis", e)
+                doctor_response = f"Based on your symptoms: {speech_to_text_output}. {SYMPTOM_FALLBACK_ADVICE}"
+
+    # Show the full answer right away, the voice follows once it is rendered
+    doctor_response = caution + doctor_response
+    metrics.inc("payload_bytes_total", len(doctor_response.encode("utf-8")), direction="out", kind="response_text")
+    yield speech_to_text_output, doctor_response, None
+    yield from speak(speech_to_text_output, doctor_response, doctor_response, tts_deadline, session_id, trace)
+
 
+def speak(speech_to_text_output, doctor_response, voice_text, tts_deadline, session_id, trace):
     # Generate voice response
+    if PROGRESSIVE_TTS:
+        try:
+            audio_chunks = stream_text_to_speech(voice_text, backend=TTS_BACKEND)
+            with metrics.span("tts", trace):
+                for audio_chunk in stream_with_deadline(audio_chunks, tts_deadline, "Voice generation"):
+                    metrics.inc("payload_bytes_total", len(audio_chunk), direction="out", kind="voice")
+                    yield speech_to_text_output, doctor_response, audio_chunk
+        except Exception as e:
+            metrics.inc("api_errors_total", backend=TTS_BACKEND, error=type(e).__name__)
+            record_error(trace, "tts", e)
+            print(f"Voice generation error: {e}")
+        return
+
     try:
-        voice_of_doctor = text_to_speech_with_gtts(
-            input_text=doctor_response, 
-            output_filepath="final.mp3"
+        tts_future = submit_stage(
+            voice_stage_pool,
+            metrics.timed("tts", write_voice_artifact, trace),
+            input_text=voice_text, 
+            session_id=session_id
         )
+        voice_of_doctor = wait_for_stage(tts_future, tts_deadline, "Voice generation")
+        metrics.inc("payload_bytes_total", os.path.getsize(voice_of_doctor), direction="out", kind="voice")
     except Exception as e:
+        metrics.inc("api_errors_total", backend=TTS_BACKEND, error=type(e).__name__)
+        record_error(trace, "tts", e)
         voice_of_doctor = None
         print(f"Voice generation error: {e}")
 
-    return speech_to_text_output, doctor_response, voice_of_doctor
+    yield speech_to_text_output, doctor_response, voice_of_doctor
 
 
 # Custom CSS for better styling
@@ -380,9 +708,11 @@ with gr.Blocks(
         with gr.Column(scale=1):
             with gr.Column(elem_classes="input-section"):
                 gr.Markdown("### 📷 Medical Imaging")
-                image_input = gr.Image(
+                image_input = gr.File(
+                    file_count="multiple",
+                    file_types=["image"],
                     type="filepath",
-                    label="Upload Medical Image",
+                    label="Upload Medical Images (several angles are analyzed together)",
                     height=300
                 )
                 
@@ -396,6 +726,32 @@ with gr.Blocks(
                 - Mouth sores
                 """)
     
+    # Stage Deadlines
+    with gr.Row():
+        with gr.Accordion("⏱️ ADVANCED: STAGE DEADLINES", open=False):
+            gr.Markdown("*Maximum seconds each stage may take before the consult moves on without it*")
+            with gr.Row():
+                transcription_deadline = gr.Slider(
+                    minimum=1, maximum=120, step=1,
+                    value=STAGE_DEADLINES["transcription"],
+                    label="🎤 Transcription"
+                )
+                image_deadline = gr.Slider(
+                    minimum=1, maximum=60, step=1,
+                    value=STAGE_DEADLINES["image"],
+                    label="📷 Image Processing"
+                )
+                llm_deadline = gr.Slider(
+                    minimum=1, maximum=180, step=1,
+                    value=STAGE_DEADLINES["llm"],
+                    label="🩺 AI Analysis"
+                )
+                tts_deadline = gr.Slider(
+                    minimum=1, maximum=120, step=1,
+                    value=STAGE_DEADLINES["tts"],
+                    label="🔊 Voice Generation"
+                )
+    
     # Buttons Row
     with gr.Row():
         with gr.Column():
@@ -433,6 +789,7 @@ with gr.Blocks(
                         gr.Markdown("### 🔊 LISTEN TO DIAGNOSIS")
                         audio_output = gr.Audio(
                             label="🔊 DOCTOR'S VOICE RESPONSE",
+                            streaming=PROGRESSIVE_TTS,
                             autoplay=True,
                             show_download_button=True
                         )
@@ -473,7 +830,10 @@ with gr.Blocks(
     # Event Handlers
     submit_btn.click(
         fn=process_inputs,
-        inputs=[audio_input, image_input, common_symptoms],
+        api_name="consult",
+        concurrency_limit=CONSULT_CONCURRENCY,
+        inputs=[audio_input, image_input, common_symptoms,
+                transcription_deadline, image_deadline, llm_deadline, tts_deadline],
         outputs=[speech_text, doctor_response, audio_output]
     )
     
@@ -486,9 +846,22 @@ with gr.Blocks(
 
 # Launch the interface
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    # Build the shared Groq connection pool in the background, the UI can come up meanwhile
+    threading.Thread(target=get_groq_client, name="groq-warmup", daemon=True).start()
+    metrics.start_metrics_server()
+    knowledge_base.current()
+    if knowledge_base.KB_HOT_RELOAD:
+        knowledge_base.start_watcher()
+    start_garbage_collector()
+    if consultation_store.CONSULT_STORE_ENABLED:
+        consultation_store.get_store().start()
+    if TTS_WARMUP:
+        threading.Thread(target=prerender_predefined_responses, name="tts-warmup", daemon=True).start()
     demo.launch(
-        server_name="127.0.0.1",
-        server_port=7861,
+        server_name=os.environ.get("GRADIO_SERVER_NAME", "127.0.0.1"),
+        server_port=int(os.environ.get("GRADIO_SERVER_PORT", 7861)),
         share=False,
-        debug=True
+        debug=True,
+        allowed_paths=[ARTIFACT_DIR]
     )
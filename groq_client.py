@@ -0,0 +1,86 @@
+#Shared Groq clients
+#One pooled client per API key for the whole process, so every consult reuses warm
+#keep-alive connections instead of paying a new TLS handshake per request.
+#The SDK's own retries are off, rate_limiter retries with the shared RPM/TPM budget.
+#httpx and the groq SDK are imported with the first client, not at app start.
+import os
+import asyncio
+import weakref
+import threading
+
+GROQ_POOL_SIZE=int(os.environ.get("GROQ_POOL_SIZE", 20))
+GROQ_KEEPALIVE_CONNECTIONS=int(os.environ.get("GROQ_KEEPALIVE_CONNECTIONS", GROQ_POOL_SIZE))
+GROQ_KEEPALIVE_EXPIRY=float(os.environ.get("GROQ_KEEPALIVE_EXPIRY", 60))
+GROQ_CONNECT_TIMEOUT=float(os.environ.get("GROQ_CONNECT_TIMEOUT", 5))
+GROQ_TIMEOUT=float(os.environ.get("GROQ_TIMEOUT", 60))
+
+_clients={}
+_async_clients=weakref.WeakKeyDictionary()
+_lock=threading.Lock()
+
+
+def _limits():
+    import httpx
+
+    return httpx.Limits(
+        max_connections=GROQ_POOL_SIZE,
+        max_keepalive_connections=GROQ_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=GROQ_KEEPALIVE_EXPIRY,
+    )
+
+
+def _timeout():
+    import httpx
+
+    return httpx.Timeout(GROQ_TIMEOUT, connect=GROQ_CONNECT_TIMEOUT)
+
+
+def _resolve_key(api_key):
+    return api_key or os.environ.get("GROQ_API_KEY")
+
+
+def get_groq_client(api_key=None):
+    """Return the process-wide pooled Groq client for api_key (thread-safe)."""
+    api_key=_resolve_key(api_key)
+    client=_clients.get(api_key)
+    if client is not None:
+        return client
+    with _lock:
+        client=_clients.get(api_key)
+        if client is None:
+            import httpx
+            from groq import Groq
+
+            http_client=httpx.Client(limits=_limits(), timeout=_timeout())
+            client=Groq(api_key=api_key, timeout=_timeout(), max_retries=0, http_client=http_client)
+            _clients[api_key]=client
+    return client
+
+
+def get_async_groq_client(api_key=None):
+    """Return the pooled AsyncGroq client for api_key and the running event loop.
+
+    httpx async pools are bound to the loop that created them, so each loop gets its own.
+    """
+    api_key=_resolve_key(api_key)
+    loop=asyncio.get_running_loop()
+    with _lock:
+        loop_clients=_async_clients.setdefault(loop, {})
+        client=loop_clients.get(api_key)
+        if client is None:
+            import httpx
+            from groq import AsyncGroq
+
+            http_client=httpx.AsyncClient(limits=_limits(), timeout=_timeout())
+            client=AsyncGroq(api_key=api_key, timeout=_timeout(), max_retries=0, http_client=http_client)
+            loop_clients[api_key]=client
+    return client
+
+
+def close_clients():
+    """Close every pooled sync client (async ones are dropped with their loops)."""
+    with _lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+        _async_clients.clear()
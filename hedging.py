@@ -0,0 +1,179 @@
+#Hedged LLM requests
+#If the primary model has not produced its first token by the HEDGE_PERCENTILE of its
+#recent first-token latencies, the same question goes to a backup model and whichever
+#stream starts first is used; the other one is closed at its next chunk. A budget caps
+#hedges at HEDGE_BUDGET of primary requests, so the tail drops without doubling cost.
+import os
+import time
+import queue
+import threading
+from collections import deque
+
+import metrics
+
+#Set HEDGING_ENABLED=1 to hedge slow answers against HEDGE_BACKUP_MODEL
+HEDGING_ENABLED=os.environ.get("HEDGING_ENABLED", "0") == "1"
+HEDGE_BACKUP_MODEL=os.environ.get("HEDGE_BACKUP_MODEL", "meta-llama/llama-4-maverick-17b-128e-instruct")
+HEDGE_PERCENTILE=float(os.environ.get("HEDGE_PERCENTILE", 0.95))
+#Hedge delay until HEDGE_MIN_SAMPLES first-token latencies have been seen
+HEDGE_DEFAULT_DELAY=float(os.environ.get("HEDGE_DEFAULT_DELAY", 2.0))
+HEDGE_MIN_SAMPLES=int(os.environ.get("HEDGE_MIN_SAMPLES", 20))
+HEDGE_BUDGET=float(os.environ.get("HEDGE_BUDGET", 0.05))
+HEDGE_BUDGET_BURST=float(os.environ.get("HEDGE_BUDGET_BURST", 3))
+
+_DONE=object()
+
+
+class LatencyTracker:
+    """Recent first-token latencies of one model."""
+
+    def __init__(self, window=500):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, fraction, default=HEDGE_DEFAULT_DELAY, min_samples=HEDGE_MIN_SAMPLES):
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < min_samples:
+            return default
+        return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+class HedgeBudget:
+    """Every primary request earns `ratio` of a hedge and every hedge spends one, up to `burst` saved."""
+
+    def __init__(self, ratio=HEDGE_BUDGET, burst=HEDGE_BUDGET_BURST):
+        self.ratio = ratio
+        self.burst = burst
+        self.balance = burst
+        self._lock = threading.Lock()
+
+    def earn(self):
+        with self._lock:
+            self.balance = min(self.burst, self.balance + self.ratio)
+
+    def try_spend(self):
+        with self._lock:
+            if self.balance < 1:
+                return False
+            self.balance -= 1
+            return True
+
+
+_trackers = {}
+_trackers_lock = threading.Lock()
+_budget = HedgeBudget()
+
+
+def tracker_for(model, kind="first_token"):
+    """Latencies of one model; kind is "first_token" (streams) or "completion" (whole answers)."""
+    with _trackers_lock:
+        return _trackers.setdefault((model, kind), LatencyTracker())
+
+
+def should_hedge(model):
+    return HEDGING_ENABLED and model != HEDGE_BACKUP_MODEL
+
+
+def _pump(model, factory, items, cancelled, started_at, kind):
+    """Feed one model's stream into the shared queue until it ends or loses the race."""
+    iterator = factory()
+    first = True
+    try:
+        for item in iterator:
+            if first:
+                first = False
+                elapsed = time.monotonic() - started_at
+                tracker_for(model, kind).record(elapsed)
+                if kind == "first_token":
+                    metrics.observe("llm_first_token_seconds", elapsed, model=model)
+            if cancelled.is_set():
+                return
+            items.put((model, item))
+        items.put((model, _DONE))
+    except Exception as e:
+        items.put((model, e))
+    finally:
+        iterator.close()
+
+
+def hedged_stream(primary_model, primary_factory, backup_model, backup_factory, kind="first_token"):
+    """Yield the items of the primary stream, or of the backup if it starts first after a hedge.
+
+    kind="completion" is for factories that yield one whole answer; their latencies are tracked
+    apart from the first-token latencies of real streams.
+    """
+    _budget.earn()
+    items = queue.Queue()
+    cancelled = {primary_model: threading.Event(), backup_model: threading.Event()}
+    started_at = time.monotonic()
+    hedge_at = started_at + tracker_for(primary_model, kind).percentile(HEDGE_PERCENTILE)
+
+    def start(model, factory):
+        threading.Thread(target=_pump, args=(model, factory, items, cancelled[model], time.monotonic(), kind),
+                         name="llm-hedge", daemon=True).start()
+
+    def hedge(reason):
+        if _budget.try_spend():
+            metrics.inc("llm_hedges_total", reason=reason)
+            start(backup_model, backup_factory)
+            return True
+        metrics.inc("llm_hedges_over_budget_total")
+        return False
+
+    start(primary_model, primary_factory)
+    running = {primary_model}
+    # hedged: the backup was actually sent; waited: the hedge delay passed (sent or refused)
+    hedged = False
+    waited = False
+    first_error = None
+    try:
+        # Race until one stream delivers its first item
+        while True:
+            timeout = None if waited or hedged else max(0.0, hedge_at - time.monotonic())
+            try:
+                model, item = items.get(timeout=timeout)
+            except queue.Empty:
+                waited = True
+                if hedge("slow"):
+                    hedged = True
+                    running.add(backup_model)
+                continue
+            if item is _DONE:
+                return
+            if isinstance(item, Exception):
+                running.discard(model)
+                first_error = first_error or item
+                if model == primary_model and not hedged:
+                    # The primary failed outright: the backup doubles as a failover
+                    if hedge("error"):
+                        hedged = True
+                        running.add(backup_model)
+                if not running:
+                    raise first_error
+                continue
+            winner = model
+            break
+
+        for model in running - {winner}:
+            cancelled[model].set()
+        if hedged:
+            metrics.inc("llm_hedge_wins_total", model=winner)
+        yield item
+
+        while True:
+            model, item = items.get()
+            if model != winner:
+                continue
+            if item is _DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        for event in cancelled.values():
+            event.set()
@@ -0,0 +1,123 @@
+#Image preprocessing before the vision model
+#Uploads are rotated per EXIF, downscaled, re-encoded and base64-encoded under a hard cap,
+#so phone photos and large PNGs do not cost upload time and vision-model latency.
+import os
+import base64
+import hashlib
+import mimetypes
+from io import BytesIO
+
+IMAGE_MAX_DIMENSION=int(os.environ.get("IMAGE_MAX_DIMENSION", 1024))
+IMAGE_FORMAT=os.environ.get("IMAGE_FORMAT", "JPEG").upper()
+IMAGE_QUALITY=int(os.environ.get("IMAGE_QUALITY", 85))
+#Groq rejects base64 image payloads above 4 MB
+IMAGE_MAX_BASE64_BYTES=int(os.environ.get("IMAGE_MAX_BASE64_BYTES", 4 * 1024 * 1024))
+#Groq's vision models take at most 5 images per request
+MAX_IMAGES_PER_REQUEST=int(os.environ.get("MAX_IMAGES_PER_REQUEST", 5))
+
+MIME_TYPES={
+    "JPEG": "image/jpeg",
+    "WEBP": "image/webp",
+    "PNG": "image/png",
+}
+
+#Multiple of 3 so every chunk encodes to base64 without padding
+_ENCODE_CHUNK_BYTES=3 * 64 * 1024
+
+
+#16-bit and float grayscale (typical X-ray exports); a plain convert() would clip them at 255
+_HIGH_DEPTH_MODES=("I;16", "I;16L", "I;16B", "I;16N", "I", "F")
+
+
+def _to_8bit(image):
+    """Stretch a high bit depth grayscale image onto 0-255 ("L" mode)."""
+    import numpy as np
+    from PIL import Image
+
+    pixels=np.asarray(image, dtype=np.float32)
+    low, high=float(pixels.min()), float(pixels.max())
+    scale=255.0 / (high - low) if high > low else 0.0
+    return Image.fromarray(((pixels - low) * scale).round().astype(np.uint8))
+
+
+def preprocess_image(image_path, max_dimension=None, image_format=None, quality=None):
+    """EXIF-aware resize and re-encode; returns (image bytes, MIME type)."""
+    from PIL import Image, ImageOps
+
+    max_dimension=max_dimension or IMAGE_MAX_DIMENSION
+    image_format=(image_format or IMAGE_FORMAT).upper()
+    quality=quality or IMAGE_QUALITY
+
+    with Image.open(image_path) as image:
+        image=ImageOps.exif_transpose(image)
+        if image.mode in _HIGH_DEPTH_MODES:
+            image=_to_8bit(image)
+        image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+        if image_format == "JPEG" and image.mode != "RGB":
+            if image.mode in ("RGBA", "LA", "P"):
+                image=image.convert("RGBA")
+                background=Image.new("RGB", image.size, (255, 255, 255))
+                background.paste(image, mask=image.getchannel("A"))
+                image=background
+            else:
+                image=image.convert("RGB")
+
+        output=BytesIO()
+        image.save(output, format=image_format, quality=quality, optimize=True)
+    return output.getvalue(), MIME_TYPES[image_format]
+
+
+def file_digest(path):
+    """SHA-256 of a file's bytes."""
+    digest=hashlib.sha256()
+    with open(path, "rb") as image_file:
+        for chunk in iter(lambda: image_file.read(_ENCODE_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def unique_images(image_paths, max_images=None):
+    """Uploaded image paths in order, without byte-identical duplicates and capped at max_images."""
+    max_images=max_images or MAX_IMAGES_PER_REQUEST
+    unique_paths=[]
+    seen=set()
+    for image_path in image_paths:
+        digest=file_digest(image_path)
+        if digest not in seen:
+            seen.add(digest)
+            unique_paths.append(image_path)
+    if len(unique_paths) > max_images:
+        print(f"Only the first {max_images} of {len(unique_paths)} images are analyzed")
+    return unique_paths[:max_images]
+
+
+def b64encode_capped(stream, max_bytes=None):
+    """Base64-encode a binary stream chunk by chunk, failing as soon as the output passes max_bytes."""
+    max_bytes=max_bytes or IMAGE_MAX_BASE64_BYTES
+    encoded_chunks=[]
+    encoded_size=0
+    while True:
+        chunk=stream.read(_ENCODE_CHUNK_BYTES)
+        if not chunk:
+            break
+        encoded=base64.b64encode(chunk)
+        encoded_size+=len(encoded)
+        if encoded_size > max_bytes:
+            raise ValueError(f"Encoded image exceeds the {max_bytes} byte limit")
+        encoded_chunks.append(encoded)
+    return b"".join(encoded_chunks).decode("ascii")
+
+
+def prepare_image(image_path):
+    """Preprocessed, base64-encoded image and its MIME type, ready for an image_url part."""
+    try:
+        image_bytes, mime_type=preprocess_image(image_path)
+    except Exception as e:
+        # Not something Pillow can decode: send the original file untouched
+        print(f"Image preprocessing skipped: {e}")
+        mime_type=mimetypes.guess_type(image_path)[0] or ""
+        if not mime_type.startswith("image/"):
+            mime_type="image/jpeg"
+        with open(image_path, "rb") as image_file:
+            return b64encode_capped(image_file), mime_type
+    return b64encode_capped(BytesIO(image_bytes)), mime_type
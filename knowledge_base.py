@@ -0,0 +1,161 @@
+#Condition knowledge base
+#The pre-defined condition table lives in an external JSON or YAML file. It is compiled
+#once per content version into NumPy arrays on disk that every worker process memory-maps,
+#so they share one copy through the page cache. A watcher thread hot-reloads the file and
+#swaps in a new snapshot atomically; readers just grab current() without any lock, and
+#in-flight requests keep using the snapshot they started with.
+import os
+import json
+import time
+import hashlib
+import threading
+
+import numpy as np
+
+from symptom_matcher import SymptomMatcher, compile_solutions
+
+CONDITIONS_PATH=os.environ.get("CONDITIONS_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "conditions.json"))
+KB_COMPILED_DIR=os.environ.get("KB_COMPILED_DIR", os.path.join(".cache", "knowledge_base"))
+KB_HOT_RELOAD=os.environ.get("KB_HOT_RELOAD", "1") == "1"
+KB_WATCH_INTERVAL=float(os.environ.get("KB_WATCH_INTERVAL", 2))
+
+REQUIRED_FIELDS=("symptoms", "condition", "advice", "urgency")
+_ARRAY_NAMES=("matrix", "weights", "inverted_indptr", "inverted_indices")
+
+
+class KnowledgeBaseSnapshot:
+    """One immutable version of the condition table and its compiled matcher."""
+
+    def __init__(self, solutions, matcher, version, source_mtime):
+        self.solutions=solutions
+        self.matcher=matcher
+        self.version=version
+        self.source_mtime=source_mtime
+
+
+def parse_conditions(raw_bytes, path):
+    if path.endswith((".yaml", ".yml")):
+        import yaml
+        solutions=yaml.safe_load(raw_bytes)
+    else:
+        solutions=json.loads(raw_bytes)
+
+    if not isinstance(solutions, dict):
+        raise ValueError(f"{path} must map condition ids to conditions")
+    for condition_id, condition in solutions.items():
+        if not isinstance(condition, dict):
+            raise ValueError(f"Condition {condition_id!r} in {path} must be a mapping")
+        missing=[field for field in REQUIRED_FIELDS if field not in condition]
+        if missing:
+            raise ValueError(f"Condition {condition_id!r} in {path} is missing {', '.join(missing)}")
+        # A bare string would be compiled letter by letter into the vocabulary
+        symptoms=condition["symptoms"]
+        if not isinstance(symptoms, list) or not symptoms or not all(
+                isinstance(symptom, str) and symptom.strip() for symptom in symptoms):
+            raise ValueError(f"Condition {condition_id!r} in {path}: symptoms must be a non-empty list of names")
+        wrong=[field for field in REQUIRED_FIELDS[1:] if not isinstance(condition[field], str)]
+        if wrong:
+            raise ValueError(f"Condition {condition_id!r} in {path}: {', '.join(wrong)} must be text")
+    return solutions
+
+
+def compile_to_disk(solutions, compiled_dir):
+    """Write the compiled arrays to compiled_dir (atomically, so concurrent workers can race safely)."""
+    if os.path.exists(os.path.join(compiled_dir, "vocabulary.json")):
+        return
+    vocabulary, *arrays=compile_solutions(solutions)
+    tmp_dir=f"{compiled_dir}.tmp-{os.getpid()}-{threading.get_ident()}"
+    os.makedirs(tmp_dir, exist_ok=True)
+    for name, array in zip(_ARRAY_NAMES, arrays):
+        np.save(os.path.join(tmp_dir, name + ".npy"), array)
+    with open(os.path.join(tmp_dir, "vocabulary.json"), "w", encoding="utf-8") as vocabulary_file:
+        json.dump(vocabulary, vocabulary_file, ensure_ascii=False)
+    try:
+        os.rename(tmp_dir, compiled_dir)
+    except OSError:
+        # Another worker finished compiling the same version first
+        for name in os.listdir(tmp_dir):
+            os.remove(os.path.join(tmp_dir, name))
+        os.rmdir(tmp_dir)
+
+
+def load_snapshot(path=None):
+    """Read, validate and compile the condition file, then memory-map the compiled arrays."""
+    path=path or CONDITIONS_PATH
+    source_mtime=os.path.getmtime(path)
+    with open(path, "rb") as source_file:
+        raw_bytes=source_file.read()
+    solutions=parse_conditions(raw_bytes, path)
+
+    version=hashlib.sha256(raw_bytes).hexdigest()[:16]
+    compiled_dir=os.path.join(KB_COMPILED_DIR, version)
+    os.makedirs(KB_COMPILED_DIR, exist_ok=True)
+    compile_to_disk(solutions, compiled_dir)
+
+    with open(os.path.join(compiled_dir, "vocabulary.json"), encoding="utf-8") as vocabulary_file:
+        vocabulary=json.load(vocabulary_file)
+    arrays=[np.load(os.path.join(compiled_dir, name + ".npy"), mmap_mode="r") for name in _ARRAY_NAMES]
+    matcher=SymptomMatcher.from_compiled(solutions, vocabulary, *arrays)
+    return KnowledgeBaseSnapshot(solutions, matcher, version, source_mtime)
+
+
+_current=None
+_reload_lock=threading.RLock()
+_watcher=None
+_failed_mtime=None
+
+
+def current():
+    """The active snapshot (lock-free: a single attribute read)."""
+    snapshot=_current
+    if snapshot is None:
+        with _reload_lock:
+            snapshot=_current or reload()
+    return snapshot
+
+
+def reload(path=None):
+    """Load the condition file and atomically make it the active snapshot."""
+    global _current
+    with _reload_lock:
+        snapshot=load_snapshot(path)
+        _current=snapshot
+    print(f"✅ Loaded {len(snapshot.solutions)} conditions (version {snapshot.version})")
+    return snapshot
+
+
+def reload_if_changed(path=None):
+    """Reload when the file's mtime moved; a broken edit keeps the previous snapshot."""
+    global _failed_mtime
+    path=path or CONDITIONS_PATH
+    source_mtime=None
+    try:
+        source_mtime=os.path.getmtime(path)
+        if _current is not None and source_mtime == _current.source_mtime:
+            return False
+        if source_mtime == _failed_mtime:
+            return False
+        reload(path)
+        return True
+    except Exception as e:
+        _failed_mtime=source_mtime
+        print(f"Knowledge base reload failed, keeping the previous version: {e}")
+        return False
+
+
+def start_watcher(interval=None, path=None):
+    """Poll the condition file every interval seconds in a daemon thread (started once per process)."""
+    global _watcher
+    interval=KB_WATCH_INTERVAL if interval is None else interval
+    with _reload_lock:
+        if _watcher is not None:
+            return _watcher
+
+        def watch():
+            while True:
+                time.sleep(interval)
+                reload_if_changed(path)
+
+        _watcher=threading.Thread(target=watch, name="knowledge-base-watcher", daemon=True)
+        _watcher.start()
+        return _watcher
@@ -0,0 +1,222 @@
+#Hot-path instrumentation
+#Timing spans around every consult stage plus counters for cache hits, fast-path hits,
+#API errors and payload sizes, exposed in Prometheus text format on a local HTTP
+#endpoint. With TRACE_LOG set, every consult also appends one JSON line with its spans.
+import os
+import json
+import time
+import uuid
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_HOST=os.environ.get("METRICS_HOST", "127.0.0.1")
+#Set METRICS_PORT=0 to disable the endpoint
+METRICS_PORT=int(os.environ.get("METRICS_PORT", 9464))
+TRACE_LOG=os.environ.get("TRACE_LOG")
+
+PREFIX="ai_doctor_"
+DURATION_BUCKETS=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+HELP={
+    "stage_duration_seconds": "Time spent in each consult stage",
+    "stage_errors_total": "Consult stages that raised",
+    "consults_total": "Consults started",
+    "cache_hits_total": "Cache lookups that hit",
+    "cache_misses_total": "Cache lookups that missed",
+    "fast_path_hits_total": "Consults answered from the pre-defined conditions",
+    "coalesced_requests_total": "Backend calls shared with an identical in-flight call",
+    "api_errors_total": "Failed calls to external APIs",
+    "api_retries_total": "Groq calls retried after a rate limit or transient error",
+    "rate_limit_wait_seconds": "Time Groq calls queued for their rate-limit budget",
+    "rate_limit_timeouts_total": "Groq calls that gave up waiting for their rate-limit budget",
+    "circuit_breaker_transitions_total": "Circuit breaker state changes",
+    "circuit_breaker_rejections_total": "Calls failed fast by an open circuit breaker",
+    "circuit_breaker_slow_calls_total": "Calls slower than their backend's latency SLO",
+    "llm_first_token_seconds": "Time until the first token of an LLM answer",
+    "llm_hedges_total": "Backup LLM requests sent because the primary was slow or failed",
+    "llm_hedges_over_budget_total": "Hedges skipped because the hedge budget was spent",
+    "llm_hedge_wins_total": "Hedged answers by the model that answered first",
+    "similarity_cache_lookups_total": "Near-duplicate symptom cache lookups by result (hit/miss)",
+    "similarity_cache_entries": "Answers held by the near-duplicate symptom cache",
+    "similarity_cache_threshold": "Jaccard similarity a cached symptom text needs to be reused",
+    "admissions_total": "Consult admissions by priority class and result (admitted/timed_out/rejected)",
+    "red_flag_consults_total": "Consults answered by the emergency fast path",
+    "caution_consults_total": "Consults answered normally with a caution for soft red flags",
+    "consult_store_written_total": "Consult records written to the consultation store",
+    "consult_store_dropped_total": "Consult records dropped, by reason (queue_full/unavailable/error)",
+    "consult_store_start_errors_total": "Failed attempts to open the consultation store",
+    "consult_store_write_errors_total": "Consultation store batches that failed to write",
+    "consult_store_queue_depth": "Consult records waiting to be written",
+    "consult_store_batch_seconds": "Time to write one batch of consult records",
+    "payload_bytes_total": "Bytes received from users (in) and sent back or to APIs (out)",
+}
+
+_lock=threading.Lock()
+_counters={}
+_gauges={}
+_histograms={}
+_trace_lock=threading.Lock()
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def inc(name, amount=1, **labels):
+    key=(name, _label_key(labels))
+    with _lock:
+        _counters[key]=_counters.get(key, 0) + amount
+
+
+def set_gauge(name, value, **labels):
+    with _lock:
+        _gauges[(name, _label_key(labels))]=value
+
+
+def observe(name, value, **labels):
+    key=(name, _label_key(labels))
+    with _lock:
+        histogram=_histograms.get(key)
+        if histogram is None:
+            histogram=_histograms[key]={"buckets": [0] * len(DURATION_BUCKETS), "sum": 0.0, "count": 0}
+        for index, bound in enumerate(DURATION_BUCKETS):
+            if value <= bound:
+                histogram["buckets"][index]+=1
+        histogram["sum"]+=value
+        histogram["count"]+=1
+
+
+class RequestTrace:
+    """Spans and fields of one consult, written to TRACE_LOG when finished."""
+
+    def __init__(self, **fields):
+        self.trace_id=uuid.uuid4().hex
+        self.started_at=time.time()
+        self.spans=[]
+        self.fields=fields
+
+    def add_span(self, stage, seconds, error=None):
+        span={"stage": stage, "ms": round(seconds * 1000, 2)}
+        if error:
+            span["error"]=error
+        self.spans.append(span)
+
+    def stage_timings(self):
+        #Parallel runs of one stage (e.g. several images) count as the slowest of them
+        timings={}
+        for span in self.spans:
+            timings[span["stage"]]=max(span["ms"], timings.get(span["stage"], 0))
+        return timings
+
+    def finish(self, **fields):
+        self.fields.update(fields)
+        if not TRACE_LOG:
+            return
+        record={
+            "trace_id": self.trace_id,
+            "started_at": self.started_at,
+            "total_ms": round((time.time() - self.started_at) * 1000, 2),
+            "spans": self.spans,
+            **self.fields,
+        }
+        with _trace_lock, open(TRACE_LOG, "a", encoding="utf-8") as trace_file:
+            trace_file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
+
+@contextmanager
+def span(stage, trace=None):
+    """Time a block as one stage; exceptions are counted and re-raised."""
+    started_at=time.perf_counter()
+    error=None
+    try:
+        yield
+    except BaseException as e:
+        error=type(e).__name__
+        inc("stage_errors_total", stage=stage)
+        raise
+    finally:
+        elapsed=time.perf_counter() - started_at
+        observe("stage_duration_seconds", elapsed, stage=stage)
+        if trace is not None:
+            trace.add_span(stage, elapsed, error)
+
+
+def timed(stage, function, trace=None):
+    """Wrap function so each call is recorded as a span (for work submitted to a pool)."""
+    def run(*args, **kwargs):
+        with span(stage, trace):
+            return function(*args, **kwargs)
+    return run
+
+
+def _format_labels(labels, extra=()):
+    pairs=list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped=[(key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for key, value in pairs]
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+def render_prometheus():
+    """All metrics in the Prometheus text exposition format."""
+    with _lock:
+        counters=dict(_counters)
+        gauges=dict(_gauges)
+        histograms={key: {"buckets": list(h["buckets"]), "sum": h["sum"], "count": h["count"]} for key, h in _histograms.items()}
+
+    lines=[]
+    for name in sorted({name for name, _ in counters}):
+        lines.append(f"# HELP {PREFIX}{name} {HELP.get(name, name)}")
+        lines.append(f"# TYPE {PREFIX}{name} counter")
+        for (metric, labels), value in sorted(counters.items()):
+            if metric == name:
+                lines.append(f"{PREFIX}{name}{_format_labels(labels)} {value}")
+
+    for name in sorted({name for name, _ in gauges}):
+        lines.append(f"# HELP {PREFIX}{name} {HELP.get(name, name)}")
+        lines.append(f"# TYPE {PREFIX}{name} gauge")
+        for (metric, labels), value in sorted(gauges.items()):
+            if metric == name:
+                lines.append(f"{PREFIX}{name}{_format_labels(labels)} {value}")
+
+    for name in sorted({name for name, _ in histograms}):
+        lines.append(f"# HELP {PREFIX}{name} {HELP.get(name, name)}")
+        lines.append(f"# TYPE {PREFIX}{name} histogram")
+        for (metric, labels), histogram in sorted(histograms.items()):
+            if metric != name:
+                continue
+            for bound, count in zip(DURATION_BUCKETS, histogram["buckets"]):
+                lines.append(f"{PREFIX}{name}_bucket{_format_labels(labels, [('le', bound)])} {count}")
+            lines.append(f"{PREFIX}{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {histogram['count']}")
+            lines.append(f"{PREFIX}{name}_sum{_format_labels(labels)} {histogram['sum']:.6f}")
+            lines.append(f"{PREFIX}{name}_count{_format_labels(labels)} {histogram['count']}")
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body=render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_metrics_server(port=None, host=None):
+    """Serve /metrics from a daemon thread; returns the server, or None when disabled."""
+    port=METRICS_PORT if port is None else port
+    if not port:
+        return None
+    server=ThreadingHTTPServer((host or METRICS_HOST, port), _MetricsHandler)
+    server.daemon_threads=True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    print(f"📈 Metrics available at http://{host or METRICS_HOST}:{port}/metrics")
+    return server
@@ -0,0 +1,236 @@
+#Client-side rate limiting for Groq calls
+#Every model gets a scheduler with requests-per-minute and tokens-per-minute token buckets.
+#Calls wait in FIFO order when a budget is spent instead of bursting into 429s, and
+#rate-limited or transient failures are retried after the server's retry-after or a
+#jittered exponential backoff, so throughput stays at the provider ceiling.
+import os
+import time
+import random
+import threading
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+import metrics
+
+GROQ_RPM=float(os.environ.get("GROQ_RPM", 30))
+GROQ_TPM=float(os.environ.get("GROQ_TPM", 30000))
+GROQ_WHISPER_RPM=float(os.environ.get("GROQ_WHISPER_RPM", 20))
+GROQ_MAX_RETRIES=int(os.environ.get("GROQ_MAX_RETRIES", 4))
+GROQ_BACKOFF_BASE=float(os.environ.get("GROQ_BACKOFF_BASE", 0.5))
+GROQ_BACKOFF_MAX=float(os.environ.get("GROQ_BACKOFF_MAX", 20))
+#Longest a call may queue for its budget before giving up
+GROQ_MAX_QUEUE_SECONDS=float(os.environ.get("GROQ_MAX_QUEUE_SECONDS", 120))
+
+#Token estimate used to reserve TPM budget before the real usage is known
+IMAGE_TOKEN_ESTIMATE=int(os.environ.get("IMAGE_TOKEN_ESTIMATE", 1500))
+OUTPUT_TOKEN_ESTIMATE=int(os.environ.get("OUTPUT_TOKEN_ESTIMATE", 400))
+
+
+class RateLimitTimeout(TimeoutError):
+    """A call waited longer than GROQ_MAX_QUEUE_SECONDS for its rate-limit budget."""
+
+
+class TokenBucket:
+    """Budget of `per_minute` units that refills continuously; a limit of 0 means unlimited."""
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.capacity / 60)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until `amount` units are available (requests above capacity wait for a full bucket)."""
+        if not self.capacity:
+            return 0
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing * 60 / self.capacity)
+
+    def take(self, amount):
+        if self.capacity:
+            self.level -= amount
+
+    def give_back(self, amount):
+        if self.capacity:
+            self.level = min(self.capacity, self.level + amount)
+
+
+class RateLimitScheduler:
+    """Admits calls to one model in arrival order while the RPM and TPM budgets allow."""
+
+    def __init__(self, name, requests_per_minute, tokens_per_minute=0):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self._queue = deque()
+        self._paused_until = 0.0
+        self._changed = threading.Condition()
+
+    def acquire(self, tokens=0, timeout=GROQ_MAX_QUEUE_SECONDS):
+        """Block until it is this caller's turn and the budgets cover one request of `tokens`."""
+        ticket = object()
+        started_at = time.monotonic()
+        with self._changed:
+            self._queue.append(ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = None
+                    if self._queue[0] is ticket:
+                        wait = max(self._paused_until - now,
+                                   self.requests.wait_time(1, now),
+                                   self.tokens.wait_time(tokens, now))
+                        if wait <= 0:
+                            self.requests.take(1)
+                            self.tokens.take(tokens)
+                            break
+                    if timeout is not None:
+                        remaining = started_at + timeout - now
+                        if remaining <= 0:
+                            metrics.inc("rate_limit_timeouts_total", scheduler=self.name)
+                            raise RateLimitTimeout(f"{self.name}: no rate-limit budget after {timeout:g}s")
+                        wait = remaining if wait is None else min(wait, remaining)
+                    self._changed.wait(wait)
+            finally:
+                self._queue.remove(ticket)
+                self._changed.notify_all()
+        metrics.observe("rate_limit_wait_seconds", time.monotonic() - started_at, scheduler=self.name)
+
+    def settle(self, reserved_tokens, used_tokens):
+        """Correct the TPM budget once the real usage of a call is known."""
+        with self._changed:
+            if used_tokens < reserved_tokens:
+                self.tokens.give_back(reserved_tokens - used_tokens)
+            else:
+                self.tokens.take(used_tokens - reserved_tokens)
+            self._changed.notify_all()
+
+    def refund(self, tokens):
+        """Give the TPM reservation of a call that failed back to the budget."""
+        with self._changed:
+            self.tokens.give_back(tokens)
+            self._changed.notify_all()
+
+    def pause(self, seconds):
+        """Hold every queued call for `seconds`, e.g. after the server answered 429."""
+        with self._changed:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._changed.notify_all()
+
+    def call(self, function, *args, tokens=0, on_admitted=None, **kwargs):
+        """Run function(*args, **kwargs) within the budget, retrying rate limits and transient errors.
+
+        on_admitted() runs each time an attempt leaves the queue (a circuit breaker restarts its
+        latency clock there, so queueing and back-off never look like a slow backend).
+        """
+        attempt = 0
+        while True:
+            self.acquire(tokens)
+            if on_admitted is not None:
+                on_admitted()
+            try:
+                return function(*args, **kwargs)
+            except Exception as e:
+                # A failed attempt used none of its reservation; keeping it would drain TPM during a 429 burst
+                self.refund(tokens)
+                if attempt >= GROQ_MAX_RETRIES or not is_retryable(e):
+                    raise
+                delay = retry_after(e)
+                if delay is None:
+                    delay = backoff_delay(attempt)
+                if is_rate_limit(e):
+                    self.pause(delay)
+                metrics.inc("api_retries_total", scheduler=self.name, error=type(e).__name__)
+                print(f"{self.name}: {type(e).__name__}, retrying in {delay:.1f}s")
+                attempt += 1
+                time.sleep(delay)
+
+
+def is_local_throttle(error):
+    """Whether a call failed in our own rate-limit queue, without reaching the backend."""
+    return isinstance(error, RateLimitTimeout)
+
+
+def is_rate_limit(error):
+    import groq
+
+    return isinstance(error, groq.RateLimitError)
+
+
+def is_retryable(error):
+    import groq
+
+    if isinstance(error, (groq.RateLimitError, groq.APIConnectionError, groq.InternalServerError)):
+        return True
+    return isinstance(error, groq.APIStatusError) and error.status_code in (408, 409)
+
+
+def retry_after(error):
+    """Seconds the server asked us to wait (retry-after-ms / retry-after headers), or None."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt):
+    """Exponential backoff with jitter, so retrying callers do not come back in lockstep."""
+    delay = min(GROQ_BACKOFF_MAX, GROQ_BACKOFF_BASE * 2 ** attempt)
+    return random.uniform(delay / 2, delay)
+
+
+def estimate_chat_tokens(messages):
+    """Rough token count of a chat request: ~4 characters per token plus a flat cost per image."""
+    tokens = OUTPUT_TOKEN_ESTIMATE
+    for message in messages:
+        content = message["content"]
+        if isinstance(content, str):
+            tokens += len(content) // 4
+            continue
+        for part in content:
+            if part["type"] == "text":
+                tokens += len(part["text"]) // 4
+            else:
+                tokens += IMAGE_TOKEN_ESTIMATE
+    return tokens
+
+
+def usage_tokens(response):
+    """Total tokens a completion (or the last chunk of a stream) reports, or None."""
+    usage = getattr(response, "usage", None) or getattr(getattr(response, "x_groq", None), "usage", None)
+    return getattr(usage, "total_tokens", None)
+
+
+_schedulers = {}
+_lock = threading.Lock()
+
+
+def get_scheduler(model):
+    """The shared scheduler for a model (Groq budgets are per model)."""
+    scheduler = _schedulers.get(model)
+    if scheduler is None:
+        with _lock:
+            scheduler = _schedulers.get(model)
+            if scheduler is None:
+                if "whisper" in model:
+                    scheduler = RateLimitScheduler(model, GROQ_WHISPER_RPM)
+                else:
+                    scheduler = RateLimitScheduler(model, GROQ_RPM, GROQ_TPM)
+                _schedulers[model] = scheduler
+    return scheduler
@@ -0,0 +1,121 @@
+#Response cache for the multimodal LLM
+#Patients often re-submit the same photo several times per consult, so answers are
+#cached by (image, query, model) in a small in-memory LRU backed by an on-disk tier.
+import os
+import base64
+import hashlib
+import threading
+from io import BytesIO
+from collections import OrderedDict
+
+import metrics
+from shared_cache import open_cache
+
+RESPONSE_CACHE_DIR=os.environ.get("RESPONSE_CACHE_DIR", os.path.join(".cache", "responses"))
+RESPONSE_CACHE_TTL=float(os.environ.get("RESPONSE_CACHE_TTL", 7 * 24 * 3600))
+RESPONSE_CACHE_MAX_BYTES=int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", 50 * 1024 * 1024))
+RESPONSE_CACHE_MEMORY_ITEMS=int(os.environ.get("RESPONSE_CACHE_MEMORY_ITEMS", 256))
+#Set RESPONSE_CACHE_PHASH=1 so recompressed or resized re-uploads of a photo still hit
+RESPONSE_CACHE_PHASH=os.environ.get("RESPONSE_CACHE_PHASH", "0") == "1"
+RESPONSE_CACHE_ENABLED=os.environ.get("RESPONSE_CACHE_ENABLED", "1") == "1"
+
+
+class LRUCache:
+    """Thread-safe in-memory least-recently-used cache."""
+
+    def __init__(self, max_items):
+        self.max_items = max_items
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._items:
+                return None
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+def image_digest(encoded_image):
+    """Content hash of the image bytes behind a base64 string."""
+    return hashlib.sha256(base64.b64decode(encoded_image)).hexdigest()
+
+
+def perceptual_hash(encoded_image):
+    """64-bit difference hash (dHash), stable across recompression and resizing."""
+    from PIL import Image
+
+    with Image.open(BytesIO(base64.b64decode(encoded_image))) as image:
+        pixels = list(image.convert("L").resize((9, 8), Image.LANCZOS).getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            bits = (bits << 1) | (left > right)
+    return f"{bits:016x}"
+
+
+def _image_key(encoded_image):
+    if RESPONSE_CACHE_PHASH:
+        try:
+            return "phash:" + perceptual_hash(encoded_image)
+        except Exception:
+            pass
+    return "sha256:" + image_digest(encoded_image)
+
+
+def make_key(query, model, encoded_image=None):
+    """Cache key from the image content (one image or a list), the query text and the model name."""
+    if encoded_image is None:
+        image_part = "none"
+    elif isinstance(encoded_image, str):
+        image_part = _image_key(encoded_image)
+    else:
+        image_part = ",".join(_image_key(image) for image in encoded_image)
+
+    key_source = "\x00".join([model, query, image_part])
+    return hashlib.sha256(key_source.encode("utf-8")).hexdigest()
+
+
+_memory_cache = LRUCache(RESPONSE_CACHE_MEMORY_ITEMS)
+_disk_cache = open_cache("responses", RESPONSE_CACHE_DIR, RESPONSE_CACHE_TTL, RESPONSE_CACHE_MAX_BYTES, suffix=".txt")
+
+
+def get_response(key):
+    """Look a response up in memory first, then on disk (promoting disk hits)."""
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+    response = _memory_cache.get(key)
+    if response is not None:
+        metrics.inc("cache_hits_total", cache="response", tier="memory")
+        return response
+    data = _disk_cache.get(key)
+    if data is None:
+        metrics.inc("cache_misses_total", cache="response")
+        return None
+    metrics.inc("cache_hits_total", cache="response", tier="disk")
+    response = data.decode("utf-8")
+    _memory_cache.put(key, response)
+    return response
+
+
+def put_response(key, response):
+    if not RESPONSE_CACHE_ENABLED or not response:
+        return
+    _memory_cache.put(key, response)
+    try:
+        _disk_cache.put(key, response.encode("utf-8"))
+    except OSError as e:
+        print(f"Response cache write failed: {e}")
@@ -0,0 +1,212 @@
+#Multi-process serving
+#demo.launch runs one Python process, so image encoding, audio transcoding, symptom
+#matching and MP3 handling all compete for one GIL. This runs WORKERS copies of
+#gradio_app on consecutive local ports behind one public port. A small TCP proxy pins each
+#client to one worker (Gradio keeps session state and uploads in the worker's memory),
+#by its IP or, behind a load balancer, by X-Forwarded-For, and fails over to the next
+#worker if that one is down. Caches are shared through shared_cache (CACHE_BACKEND=sqlite
+#by default here), the Groq rate limits are split between the workers unless told
+#otherwise, and workers that exit are restarted.
+#
+#Usage: python serve.py --workers 4 --port 7860
+import os
+import sys
+import zlib
+import signal
+import asyncio
+import argparse
+import threading
+import subprocess
+
+import rate_limiter
+
+ROOT=os.path.dirname(os.path.abspath(__file__))
+#ip: pin by the connecting address; forwarded: by the first X-Forwarded-For address
+STICKY_MODES=("ip", "forwarded")
+#split: each worker gets 1/WORKERS of the Groq limits; full: each worker gets all of them
+BUDGET_MODES=("split", "full")
+#Request heads larger than this are routed by the connecting address
+_MAX_HEAD_BYTES=64 * 1024
+
+
+def worker_env(index, workers, port, budget="split"):
+    """Environment of one worker: its own ports, its Groq budget and the shared caches."""
+    env=dict(os.environ)
+    env["GRADIO_SERVER_NAME"]="127.0.0.1"
+    env["GRADIO_SERVER_PORT"]=str(port)
+    env["WORKER_ID"]=str(index)
+    env.setdefault("CACHE_BACKEND", "sqlite")
+    metrics_port=int(os.environ.get("METRICS_PORT", 9464))
+    env["METRICS_PORT"]=str(metrics_port + index if metrics_port else 0)
+    # Every worker paces its own calls, so each one gets its share of the account limits.
+    # When few clients carry most of the load (one IP behind a NAT or proxy), their worker
+    # would idle at 1/WORKERS of the budget; "full" lets it use all of it and leaves the
+    # rare overshoot to the 429 retries.
+    if budget == "split":
+        env["GROQ_RPM"]=str(rate_limiter.GROQ_RPM / workers)
+        env["GROQ_TPM"]=str(rate_limiter.GROQ_TPM / workers)
+        env["GROQ_WHISPER_RPM"]=str(rate_limiter.GROQ_WHISPER_RPM / workers)
+    # The TTS cache is shared, one worker warming it is enough
+    if index:
+        env["TTS_WARMUP"]="0"
+    return env
+
+
+class WorkerPool:
+    """The worker processes, restarted when they exit."""
+
+    def __init__(self, workers, base_port, budget="split"):
+        self.ports=[base_port + index for index in range(workers)]
+        self.budget=budget
+        self._processes=[None] * workers
+        self._stopping=threading.Event()
+
+    def start(self):
+        for index in range(len(self.ports)):
+            self._spawn(index)
+        threading.Thread(target=self._supervise, name="worker-supervisor", daemon=True).start()
+
+    def _spawn(self, index):
+        print(f"Starting worker {index} on 127.0.0.1:{self.ports[index]}")
+        self._processes[index]=subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, "gradio_app.py")],
+            cwd=ROOT, env=worker_env(index, len(self.ports), self.ports[index], self.budget)
+        )
+
+    def _supervise(self):
+        while not self._stopping.wait(1):
+            for index, process in enumerate(self._processes):
+                if process.poll() is not None and not self._stopping.is_set():
+                    print(f"Worker {index} exited with {process.returncode}, restarting")
+                    self._spawn(index)
+
+    def stop(self):
+        self._stopping.set()
+        for process in self._processes:
+            if process and process.poll() is None:
+                process.terminate()
+        for process in self._processes:
+            if process:
+                try:
+                    process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+
+def sticky_order(client_ip, ports):
+    """Worker ports to try for a client: its own worker first, then the others as failover."""
+    start=zlib.crc32(client_ip.encode("utf-8")) % len(ports)
+    return ports[start:] + ports[:start]
+
+
+async def _pipe(reader, writer):
+    try:
+        while True:
+            data=await reader.read(64 * 1024)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+    except (ConnectionError, asyncio.CancelledError):
+        pass
+    finally:
+        try:
+            writer.close()
+        except Exception:
+            pass
+
+
+def forwarded_client(head):
+    """First address of the X-Forwarded-For header in a request head, or None."""
+    for line in head.split(b"\r\n\r\n", 1)[0].split(b"\r\n")[1:]:
+        name, _, value=line.partition(b":")
+        if name.strip().lower() == b"x-forwarded-for":
+            return value.split(b",")[0].strip().decode("latin-1") or None
+    return None
+
+
+def close_after_response(head):
+    """The request head with "Connection: close", so the next request comes on a new, re-routed connection.
+
+    A load balancer reuses its connections for requests of different clients; without this
+    they would all stay on the worker picked for the first one. Upgrades are left alone.
+    """
+    headers, separator, body=head.partition(b"\r\n\r\n")
+    if not separator:
+        return head
+    lines=headers.split(b"\r\n")
+    names=[line.partition(b":")[0].strip().lower() for line in lines[1:]]
+    if b"upgrade" in names:
+        return head
+    kept=[line for name, line in zip(names, lines[1:]) if name not in (b"connection", b"keep-alive")]
+    return b"\r\n".join([lines[0], *kept, b"Connection: close"]) + separator + body
+
+
+async def _read_head(reader):
+    head=b""
+    while b"\r\n\r\n" not in head and len(head) < _MAX_HEAD_BYTES:
+        data=await reader.read(64 * 1024)
+        if not data:
+            break
+        head+=data
+    return head
+
+
+async def _handle(client_reader, client_writer, ports, sticky):
+    client_key=client_writer.get_extra_info("peername")[0]
+    head=b""
+    if sticky == "forwarded":
+        head=await _read_head(client_reader)
+        if not head:
+            client_writer.close()
+            return
+        client_key=forwarded_client(head) or client_key
+        head=close_after_response(head)
+    for port in sticky_order(client_key, ports):
+        try:
+            worker_reader, worker_writer=await asyncio.open_connection("127.0.0.1", port)
+            break
+        except OSError:
+            continue
+    else:
+        client_writer.close()
+        return
+    if head:
+        worker_writer.write(head)
+    await asyncio.gather(_pipe(client_reader, worker_writer), _pipe(worker_reader, client_writer))
+
+
+async def run_proxy(host, port, ports, sticky="ip"):
+    server=await asyncio.start_server(lambda reader, writer: _handle(reader, writer, ports, sticky), host, port)
+    print(f"✅ Serving {len(ports)} workers on http://{host}:{port} (sticky by {sticky})")
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser=argparse.ArgumentParser(description="Run several AI Doctor workers behind one sticky port")
+    parser.add_argument("--workers", "-w", type=int, default=int(os.environ.get("WORKERS", os.cpu_count() or 1)))
+    parser.add_argument("--host", default=os.environ.get("SERVE_HOST", "127.0.0.1"))
+    parser.add_argument("--port", "-p", type=int, default=int(os.environ.get("SERVE_PORT", 7860)))
+    parser.add_argument("--worker-port", type=int, default=int(os.environ.get("WORKER_BASE_PORT", 7870)),
+                        help="first local worker port, the others follow")
+    parser.add_argument("--sticky", choices=STICKY_MODES, default=os.environ.get("SERVE_STICKY", "ip"),
+                        help="pin clients by connecting IP, or by X-Forwarded-For behind a load balancer")
+    parser.add_argument("--budget", choices=BUDGET_MODES, default=os.environ.get("SERVE_BUDGET", "split"),
+                        help="split the Groq rate limits between the workers, or give each worker all of them")
+    args=parser.parse_args()
+
+    pool=WorkerPool(args.workers, args.worker_port, args.budget)
+    pool.start()
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        asyncio.run(run_proxy(args.host, args.port, pool.ports, args.sticky))
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        pool.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
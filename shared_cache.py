@@ -0,0 +1,214 @@
+#Cross-process cache store
+#With several worker processes (serve.py) every cache tier that outlives a request should
+#be shared, so an answer rendered by one worker is a hit in all of them. CACHE_BACKEND=disk
+#keeps one file per entry (DiskCache); CACHE_BACKEND=sqlite puts every cache in one SQLite
+#database in WAL mode, which avoids a directory listing per write and keeps eviction
+#consistent when many processes write at once.
+import os
+import time
+import sqlite3
+import threading
+
+CACHE_BACKEND=os.environ.get("CACHE_BACKEND", "disk")
+SHARED_CACHE_PATH=os.environ.get("SHARED_CACHE_PATH", os.path.join(".cache", "shared_cache.sqlite3"))
+#Seconds between full scans of a disk cache directory (expired entries, size check)
+DISK_CACHE_SCAN_INTERVAL=float(os.environ.get("DISK_CACHE_SCAN_INTERVAL", 300))
+
+SCHEMA="""
+CREATE TABLE IF NOT EXISTS entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    stored_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE INDEX IF NOT EXISTS entries_stored_at ON entries (namespace, stored_at);
+"""
+
+
+class DiskCache:
+    """On-disk key/bytes cache with a TTL and size-based eviction (oldest first).
+
+    Writes keep an approximate size counter; the directory is only scanned when that passes
+    max_bytes or every scan_interval seconds, never on every put.
+    """
+
+    def __init__(self, directory, ttl, max_bytes, suffix=".bin", scan_interval=None):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.scan_interval = DISK_CACHE_SCAN_INTERVAL if scan_interval is None else scan_interval
+        self._approx_bytes = None
+        self._next_scan = 0.0
+        self._lock = threading.Lock()
+
+    def path_for(self, key):
+        return os.path.join(self.directory, key + self.suffix)
+
+    def get(self, key):
+        path = self.path_for(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                os.remove(path)
+                return None
+            with open(path, "rb") as cached_file:
+                return cached_file.read()
+        except OSError:
+            return None
+
+    def put(self, key, data):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path_for(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as tmp_file:
+            tmp_file.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            if self._approx_bytes is not None:
+                # Overwrites are counted twice, which only makes the next scan come earlier
+                self._approx_bytes += len(data)
+            scan_due = (self._approx_bytes is None or self._approx_bytes > self.max_bytes
+                        or time.monotonic() >= self._next_scan)
+        if scan_due:
+            self.evict()
+        return path
+
+    def evict(self):
+        """Drop expired entries, then the oldest ones until the cache fits well within max_bytes."""
+        with self._lock:
+            try:
+                names = os.listdir(self.directory)
+            except OSError:
+                return
+            now = time.time()
+            entries = []
+            for name in names:
+                if not name.endswith(self.suffix):
+                    continue
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if now - stat.st_mtime > self.ttl:
+                    _remove_quietly(path)
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+            total_bytes = sum(size for _, size, _ in entries)
+            # Trim to 90% of the cap so the next scan is not due on the very next write
+            target_bytes = self.max_bytes if total_bytes <= self.max_bytes else int(self.max_bytes * 0.9)
+            for _, size, path in sorted(entries):
+                if total_bytes <= target_bytes:
+                    break
+                _remove_quietly(path)
+                total_bytes -= size
+            self._approx_bytes = total_bytes
+            self._next_scan = time.monotonic() + self.scan_interval
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class SQLiteCache:
+    """Key/bytes cache in a shared SQLite database, with the same interface, TTL and size cap as DiskCache.
+
+    Like DiskCache, writes only add to an approximate size; the namespace is summed and
+    evicted when that passes max_bytes or every scan_interval seconds.
+    """
+
+    def __init__(self, path, namespace, ttl, max_bytes, scan_interval=None):
+        self.path = path
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.scan_interval = DISK_CACHE_SCAN_INTERVAL if scan_interval is None else scan_interval
+        self._approx_bytes = None
+        self._next_scan = 0.0
+        self._size_lock = threading.Lock()
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=10)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(SCHEMA)
+            self._local.connection = connection
+        return connection
+
+    def get(self, key):
+        try:
+            row = self._connection().execute(
+                "SELECT value, stored_at FROM entries WHERE namespace = ? AND key = ?", (self.namespace, key)
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Shared cache read failed: {e}")
+            return None
+        if row is None or time.time() - row[1] > self.ttl:
+            return None
+        return bytes(row[0])
+
+    def put(self, key, data):
+        try:
+            connection = self._connection()
+            with connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO entries (namespace, key, value, size, stored_at) VALUES (?, ?, ?, ?, ?)",
+                    (self.namespace, key, data, len(data), time.time())
+                )
+            with self._size_lock:
+                if self._approx_bytes is not None:
+                    # Other workers' writes are not counted here; the interval scan catches up with them
+                    self._approx_bytes += len(data)
+                scan_due = (self._approx_bytes is None or self._approx_bytes > self.max_bytes
+                            or time.monotonic() >= self._next_scan)
+            if scan_due:
+                self.evict()
+        except sqlite3.Error as e:
+            print(f"Shared cache write failed: {e}")
+
+    def evict(self):
+        """Drop expired entries, then the oldest ones until the namespace fits well within max_bytes."""
+        connection = self._connection()
+        with self._size_lock, connection:
+            connection.execute(
+                "DELETE FROM entries WHERE namespace = ? AND stored_at < ?", (self.namespace, time.time() - self.ttl)
+            )
+            total_bytes = connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM entries WHERE namespace = ?", (self.namespace,)
+            ).fetchone()[0]
+            if total_bytes > self.max_bytes:
+                # Trim to 90% of the cap so the next scan is not due on the very next write
+                target_bytes = int(self.max_bytes * 0.9)
+                oldest = connection.execute(
+                    "SELECT key, size FROM entries WHERE namespace = ? ORDER BY stored_at", (self.namespace,)
+                )
+                evicted = []
+                for key, size in oldest:
+                    if total_bytes <= target_bytes:
+                        break
+                    evicted.append((self.namespace, key))
+                    total_bytes -= size
+                connection.executemany("DELETE FROM entries WHERE namespace = ? AND key = ?", evicted)
+            self._approx_bytes = total_bytes
+            self._next_scan = time.monotonic() + self.scan_interval
+
+
+def open_cache(namespace, directory, ttl, max_bytes, suffix=".bin"):
+    """The persistent tier of one cache, on the backend picked by CACHE_BACKEND."""
+    if CACHE_BACKEND == "sqlite":
+        return SQLiteCache(SHARED_CACHE_PATH, namespace, ttl, max_bytes)
+    if CACHE_BACKEND != "disk":
+        raise ValueError("CACHE_BACKEND must be 'disk' or 'sqlite'")
+    return DiskCache(directory, ttl, max_bytes, suffix=suffix)
@@ -0,0 +1,153 @@
+#Near-duplicate cache for the symptom-only LLM answers
+#Transcripts like "I have fever and a headache since yesterday" come back constantly with
+#small wording changes. Texts are normalized to a set of words, MinHash signatures are
+#bucketed with LSH to find candidates quickly, and a candidate whose exact Jaccard
+#similarity reaches SIMILARITY_THRESHOLD answers the consult without an LLM call.
+import os
+import re
+import zlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import metrics
+
+SIMILARITY_CACHE_ENABLED=os.environ.get("SIMILARITY_CACHE_ENABLED", "1") == "1"
+SIMILARITY_THRESHOLD=float(os.environ.get("SIMILARITY_THRESHOLD", 0.8))
+SIMILARITY_CACHE_MAX_ITEMS=int(os.environ.get("SIMILARITY_CACHE_MAX_ITEMS", 2000))
+SIMILARITY_NUM_PERM=int(os.environ.get("SIMILARITY_NUM_PERM", 64))
+SIMILARITY_BANDS=int(os.environ.get("SIMILARITY_BANDS", 16))
+
+_MERSENNE_PRIME=np.uint64((1 << 61) - 1)
+
+_STOPWORDS=frozenset("""
+a an and or but so the i im i'm ive i've me my mine we our you your he she it its they
+them their have has had having am is are was were be been being do does did doing feel
+feeling felt got get getting since for from of in on at to with by about also just really
+very some bit little lot lots kind sort this that these those there here
+patient reports symptoms symptom experiencing suffering
+""".split())
+#Negations stay attached to the next word: "no fever" must never match "fever"
+_NEGATIONS=frozenset(["no", "not", "without", "never", "dont", "don't", "isnt", "isn't"])
+_word=re.compile(r"[a-z0-9']+")
+
+
+def normalize(text):
+    """Set of content words of text (lowercased, stop words dropped, plurals folded, negations kept)."""
+    tokens=set()
+    negate=False
+    for word in _word.findall(text.lower()):
+        if word in _NEGATIONS:
+            negate=True
+            continue
+        if word in _STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word=word[:-1]
+        tokens.add("not_" + word if negate else word)
+        negate=False
+    return frozenset(tokens)
+
+
+def jaccard(left, right):
+    if not left and not right:
+        return 1.0
+    return len(left & right) / len(left | right)
+
+
+class SimilarityCache:
+    """In-memory LRU of (word set -> response) with a MinHash/LSH candidate index."""
+
+    def __init__(self, threshold=SIMILARITY_THRESHOLD, max_items=SIMILARITY_CACHE_MAX_ITEMS,
+                 num_perm=SIMILARITY_NUM_PERM, bands=SIMILARITY_BANDS, seed=1):
+        if num_perm % bands:
+            raise ValueError("SIMILARITY_NUM_PERM must be a multiple of SIMILARITY_BANDS")
+        self.threshold = threshold
+        self.max_items = max_items
+        self.bands = bands
+        self.rows = num_perm // bands
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 1 << 32, size=num_perm, dtype=np.uint64)
+        self._entries = OrderedDict()
+        self._buckets = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def _signature(self, tokens):
+        hashes = np.fromiter((zlib.crc32(token.encode("utf-8")) for token in tokens), dtype=np.uint64, count=len(tokens))
+        return ((np.outer(hashes, self._a) + self._b) % _MERSENNE_PRIME).min(axis=0)
+
+    def _band_keys(self, namespace, signature):
+        return [(namespace, band, signature[band * self.rows:(band + 1) * self.rows].tobytes())
+                for band in range(self.bands)]
+
+    def lookup(self, text, namespace=""):
+        """(response, similarity) of the closest cached text at or above the threshold, or None."""
+        tokens = normalize(text)
+        if not tokens:
+            return None
+        band_keys = self._band_keys(namespace, self._signature(tokens))
+        best = None
+        with self._lock:
+            candidates = set()
+            for band_key in band_keys:
+                candidates.update(self._buckets.get(band_key, ()))
+            for entry_id in candidates:
+                entry_tokens, response, _ = self._entries[entry_id]
+                similarity = jaccard(tokens, entry_tokens)
+                if similarity >= self.threshold and (best is None or similarity > best[2]):
+                    best = (entry_id, response, similarity)
+            if best is not None:
+                self._entries.move_to_end(best[0])
+
+        metrics.inc("similarity_cache_lookups_total", result="hit" if best else "miss")
+        if best is None:
+            return None
+        return best[1], best[2]
+
+    def store(self, text, response, namespace=""):
+        tokens = normalize(text)
+        if not tokens or not response:
+            return
+        band_keys = self._band_keys(namespace, self._signature(tokens))
+        with self._lock:
+            for entry_id in self._buckets.get(band_keys[0], ()):
+                if self._entries[entry_id][0] == tokens:
+                    self._entries[entry_id] = (tokens, response, band_keys)
+                    self._entries.move_to_end(entry_id)
+                    return
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (tokens, response, band_keys)
+            for band_key in band_keys:
+                self._buckets.setdefault(band_key, []).append(entry_id)
+            while len(self._entries) > self.max_items:
+                self._forget(*self._entries.popitem(last=False))
+            metrics.set_gauge("similarity_cache_entries", len(self._entries))
+
+    def _forget(self, entry_id, entry):
+        for band_key in entry[2]:
+            bucket = self._buckets.get(band_key)
+            if bucket is None:
+                continue
+            bucket.remove(entry_id)
+            if not bucket:
+                del self._buckets[band_key]
+
+
+_cache = SimilarityCache()
+metrics.set_gauge("similarity_cache_threshold", SIMILARITY_THRESHOLD)
+
+
+def get_similar_response(text, model):
+    """Cached answer to a near-identical symptom description for this model, as (response, similarity)."""
+    if not SIMILARITY_CACHE_ENABLED:
+        return None
+    return _cache.lookup(text, namespace=model)
+
+
+def put_similar_response(text, model, response):
+    if SIMILARITY_CACHE_ENABLED:
+        _cache.store(text, response, namespace=model)
@@ -0,0 +1,117 @@
+#Single-flight request coalescing
+#Concurrent calls with the same key share one in-flight backend call: the first caller
+#runs it and everyone who arrives before it finishes gets the same result (or error).
+#Nothing is kept once the call completes, remembering results is the caches' job.
+import os
+import threading
+
+import metrics
+
+#Set COALESCE_REQUESTS=0 to give every caller its own backend call
+COALESCE_REQUESTS=os.environ.get("COALESCE_REQUESTS", "1") == "1"
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _Stream:
+    def __init__(self):
+        self.items = []
+        self.finished = False
+        self.error = None
+        self.changed = threading.Condition()
+
+
+class SingleFlight:
+    """Coalesces concurrent identical calls, keyed by their normalized inputs."""
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self._streams = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, function, *args, **kwargs):
+        """Return function(*args, **kwargs), sharing the call with concurrent callers of key."""
+        if not COALESCE_REQUESTS:
+            return function(*args, **kwargs)
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            metrics.inc("coalesced_requests_total", flight=self.name)
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stream(self, key, factory):
+        """Iterate factory() once per key; concurrent callers replay and follow the same items.
+
+        The shared generator is driven by its own thread, so a caller that stops reading
+        early does not cut the stream short for the others.
+        """
+        if not COALESCE_REQUESTS:
+            return factory()
+
+        with self._lock:
+            flight = self._streams.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._streams[key] = _Stream()
+
+        if leader:
+            threading.Thread(target=self._drive, args=(key, flight, factory),
+                             name=f"{self.name}-flight", daemon=True).start()
+        else:
+            metrics.inc("coalesced_requests_total", flight=self.name)
+        return self._follow(flight)
+
+    def _drive(self, key, flight, factory):
+        try:
+            for item in factory():
+                with flight.changed:
+                    flight.items.append(item)
+                    flight.changed.notify_all()
+        except BaseException as e:
+            flight.error = e
+        finally:
+            with self._lock:
+                del self._streams[key]
+            with flight.changed:
+                flight.finished = True
+                flight.changed.notify_all()
+
+    def _follow(self, flight):
+        position = 0
+        while True:
+            with flight.changed:
+                while position >= len(flight.items) and not flight.finished:
+                    flight.changed.wait()
+                items = flight.items[position:]
+                finished = flight.finished
+            position += len(items)
+            yield from items
+            if finished:
+                if flight.error is not None:
+                    raise flight.error
+                return
@@ -0,0 +1,105 @@
+#Compiled symptom matching engine
+#The condition table is compiled once into a condition x symptom NumPy matrix plus an
+#inverted index (symptom -> conditions), so a query only touches the conditions that
+#share at least one of its symptoms and is scored with a single vectorized product.
+import numpy as np
+
+
+def clean_symptom_names(selected_symptoms):
+    """Strip the emoji prefix of UI choices ("🤒 Fever" -> "Fever"); plain names pass through"""
+    clean_symptoms = []
+    for symptom in selected_symptoms or []:
+        if ' ' in symptom and not symptom[0].isalnum():
+            clean_symptoms.append(symptom.split(' ', 1)[1])
+        else:
+            clean_symptoms.append(symptom)
+    return clean_symptoms
+
+
+def compile_solutions(solutions, symptom_weights=None):
+    """Compile a condition table into (vocabulary, matrix, weights, inverted_indptr, inverted_indices).
+
+    The inverted index is stored CSR-style: the conditions having vocabulary column c are
+    inverted_indices[inverted_indptr[c]:inverted_indptr[c + 1]].
+    """
+    conditions = list(solutions.values())
+
+    # Fixed vocabulary in order of first appearance
+    vocabulary = {}
+    for condition in conditions:
+        for symptom in condition["symptoms"]:
+            vocabulary.setdefault(symptom, len(vocabulary))
+
+    matrix = np.zeros((len(conditions), len(vocabulary)), dtype=np.uint8)
+    for row, condition in enumerate(conditions):
+        for symptom in condition["symptoms"]:
+            matrix[row, vocabulary[symptom]] = 1
+
+    rows, columns = np.nonzero(matrix.T)
+    inverted_indptr = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=len(vocabulary)), out=inverted_indptr[1:])
+    inverted_indices = columns.astype(np.int64)
+
+    weights = np.ones(len(vocabulary), dtype=np.float32)
+    for symptom, weight in (symptom_weights or {}).items():
+        if symptom in vocabulary:
+            weights[vocabulary[symptom]] = weight
+
+    return list(vocabulary), matrix, weights, inverted_indptr, inverted_indices
+
+
+class SymptomMatcher:
+    """Weighted top-k matching of symptom lists against a compiled condition table."""
+
+    def __init__(self, solutions, symptom_weights=None, min_matches=2):
+        self._setup(solutions, *compile_solutions(solutions, symptom_weights), min_matches=min_matches)
+
+    @classmethod
+    def from_compiled(cls, solutions, vocabulary, matrix, weights, inverted_indptr, inverted_indices, min_matches=2):
+        """Matcher over arrays built by compile_solutions (they may be read-only memory maps)"""
+        matcher = cls.__new__(cls)
+        matcher._setup(solutions, vocabulary, matrix, weights, inverted_indptr, inverted_indices, min_matches)
+        return matcher
+
+    def _setup(self, solutions, vocabulary, matrix, weights, inverted_indptr, inverted_indices, min_matches):
+        self.condition_ids = list(solutions)
+        self.conditions = [solutions[condition_id] for condition_id in self.condition_ids]
+        self.vocabulary = {symptom: column for column, symptom in enumerate(vocabulary)}
+        self.matrix = matrix
+        self.weights = weights
+        self.inverted_indptr = inverted_indptr
+        self.inverted_indices = inverted_indices
+        self.min_matches = min_matches
+
+    def encode(self, symptoms):
+        """Vocabulary columns of the known symptoms (unknown ones are ignored)"""
+        return np.array(sorted({self.vocabulary[s] for s in symptoms if s in self.vocabulary}), dtype=np.intp)
+
+    def top_k(self, symptoms, k=3):
+        """Best conditions as (condition_id, condition, score, match_count), highest score first.
+
+        Ties keep table order, and conditions with fewer than min_matches shared symptoms are skipped.
+        """
+        columns = self.encode(symptoms)
+        if len(columns) < self.min_matches:
+            return []
+
+        candidates = np.unique(np.concatenate([
+            self.inverted_indices[self.inverted_indptr[column]:self.inverted_indptr[column + 1]]
+            for column in columns
+        ]))
+        hits = self.matrix[np.ix_(candidates, columns)]
+        match_counts = hits.sum(axis=1)
+        scores = hits @ self.weights[columns]
+
+        eligible = match_counts >= self.min_matches
+        candidates, scores, match_counts = candidates[eligible], scores[eligible], match_counts[eligible]
+        order = np.lexsort((candidates, -scores))[:k]
+        return [
+            (self.condition_ids[candidates[i]], self.conditions[candidates[i]], float(scores[i]), int(match_counts[i]))
+            for i in order
+        ]
+
+    def best_match(self, symptoms):
+        matches = self.top_k(symptoms, k=1)
+        return matches[0][1] if matches else None
@@ -0,0 +1,37 @@
+import pytest
+
+import triage
+
+
+@pytest.mark.parametrize("text, flags", [
+    ("I have chest pains", ["chest pain"]),
+    ("I had seizures today", ["seizure"]),
+    ("I overdosed on pills", ["overdosed"]),
+    ("I think I'm overdosing", ["overdosing"]),
+    ("I can’t breathe", ["can't breathe"]),
+    ("I can‘t breathe", ["can't breathe"]),
+    ("I cant breath properly", ["cant breath"]),
+    ("no fever but chest pain", ["chest pain"]),
+])
+def test_urgent_phrasings(text, flags):
+    assert triage.find_red_flags(text) == flags
+    assert triage.is_urgent(flags)
+
+
+@pytest.mark.parametrize("text", [
+    "I have no chest pain, just a cough",
+    "No difficulty breathing",
+    "I don’t have chest pains or shortness of breath",
+    "a stroke of bad luck",
+])
+def test_no_red_flags(text):
+    assert triage.find_red_flags(text) == []
+
+
+@pytest.mark.parametrize("text, flags", [
+    ("I fainted once years ago", ["fainted"]),
+    ("I had two strokes", ["stroke"]),
+])
+def test_soft_phrasings(text, flags):
+    assert triage.find_red_flags(text) == flags
+    assert not triage.is_urgent(flags)
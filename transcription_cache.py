@@ -0,0 +1,46 @@
+#Transcription cache
+#Transcripts are keyed by (audio bytes, model), so re-submitting the same recording skips
+#both the FFmpeg transcoding and the Whisper call. Stored through shared_cache, so with
+#several worker processes a recording transcribed by one of them is a hit in all of them.
+import os
+import hashlib
+
+import metrics
+from shared_cache import open_cache
+
+TRANSCRIPTION_CACHE_DIR=os.environ.get("TRANSCRIPTION_CACHE_DIR", os.path.join(".cache", "transcriptions"))
+TRANSCRIPTION_CACHE_TTL=float(os.environ.get("TRANSCRIPTION_CACHE_TTL", 24 * 3600))
+TRANSCRIPTION_CACHE_MAX_BYTES=int(os.environ.get("TRANSCRIPTION_CACHE_MAX_BYTES", 20 * 1024 * 1024))
+TRANSCRIPTION_CACHE_ENABLED=os.environ.get("TRANSCRIPTION_CACHE_ENABLED", "1") == "1"
+
+_disk_cache=open_cache("transcriptions", TRANSCRIPTION_CACHE_DIR, TRANSCRIPTION_CACHE_TTL,
+                       TRANSCRIPTION_CACHE_MAX_BYTES, suffix=".txt")
+
+
+def make_key(audio_filepath, stt_model):
+    digest=hashlib.sha256(stt_model.encode("utf-8") + b"\x00")
+    with open(audio_filepath, "rb") as audio_file:
+        for chunk in iter(lambda: audio_file.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_transcript(key):
+    """Cached transcript for this key, or None."""
+    if not TRANSCRIPTION_CACHE_ENABLED:
+        return None
+    data=_disk_cache.get(key)
+    if data is None:
+        metrics.inc("cache_misses_total", cache="transcription")
+        return None
+    metrics.inc("cache_hits_total", cache="transcription", tier="disk")
+    return data.decode("utf-8")
+
+
+def put_transcript(key, transcript):
+    if not TRANSCRIPTION_CACHE_ENABLED or not transcript:
+        return
+    try:
+        _disk_cache.put(key, transcript.encode("utf-8"))
+    except OSError as e:
+        print(f"Transcription cache write failed: {e}")
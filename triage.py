@@ -0,0 +1,195 @@
+#Emergency triage and priority admission
+#Selected symptoms and the transcript are scanned for red-flag terms (the emergency list
+#shown in the UI) with one precompiled regex built from a word trie, so the scan costs a
+#single pass over the text. Terms negated just before ("no chest pain") do not count.
+#Flagged consults get a local emergency answer at once and never wait for a slot; terms that
+#often describe the past ("fainted", "stroke") only put a caution above the normal answer.
+#The rest are admitted per priority class, each with its own concurrency limit, so heavy
+#image jobs cannot starve quick symptom lookups.
+import os
+import re
+import threading
+
+import metrics
+
+QUICK_CONCURRENCY=int(os.environ.get("QUICK_CONCURRENCY", 4))
+IMAGE_CONCURRENCY=int(os.environ.get("IMAGE_CONCURRENCY", 2))
+#Seconds a consult may wait for a slot before it is told to try again. Waiters hold a Gradio
+#concurrency slot, so the wait is short and capped per class: the remaining slots stay free
+#for new arrivals, emergencies among them
+ADMISSION_TIMEOUT=float(os.environ.get("ADMISSION_TIMEOUT", 20))
+ADMISSION_MAX_WAITING=int(os.environ.get("ADMISSION_MAX_WAITING", 8))
+
+RED_FLAG_TERMS=[
+    "chest pain", "chest pressure", "chest tightness", "crushing chest",
+    "heart attack", "cardiac arrest",
+    "difficulty breathing", "trouble breathing", "shortness of breath", "short of breath",
+    "can't breathe", "cannot breathe", "cant breathe", "can't breath", "cant breath", "not breathing",
+    "choking", "choked",
+    "severe bleeding", "heavy bleeding", "bleeding heavily", "won't stop bleeding",
+    "coughing up blood", "vomiting blood",
+    "sudden weakness", "sudden numbness", "face drooping", "slurred speech", "stroke",
+    "severe head injury", "head injury", "head injuries", "unconscious", "passed out", "passing out", "fainted", "fainting",
+    "seizure", "seizing",
+    "suicidal", "suicide", "kill myself", "killing myself", "end my life", "overdose", "overdosed", "overdosing",
+    "anaphylaxis", "throat swelling", "throat closing", "swollen tongue",
+]
+
+#Often past or passing mentions ("I fainted once years ago"): the consult goes on, with a caution first
+SOFT_RED_FLAG_TERMS=frozenset(["fainted", "fainting", "passed out", "passing out", "choking", "choked", "stroke"])
+
+#Plural and verb endings a listed term may carry ("chest pains", "seizures")
+_INFLECTIONS=("ing", "es", "ed", "s")
+
+#A red flag preceded by one of these within NEGATION_WINDOW words of its clause does not count
+_NEGATIONS=frozenset([
+    "no", "not", "without", "never", "nor", "deny", "denies", "denied",
+    "dont", "don't", "doesnt", "doesn't", "didnt", "didn't", "isnt", "isn't", "wasnt", "wasn't",
+])
+NEGATION_WINDOW=3
+_clause_break=re.compile(r"[.,;:!?]|\b(?:and|but)\b", re.IGNORECASE)
+_word=re.compile(r"[a-z']+")
+_list_gap=re.compile(r",?\s*n?or\s+", re.IGNORECASE)
+#Matches that are figures of speech, checked against the text right after the term
+_false_matches={"stroke": re.compile(r"\s+of\b", re.IGNORECASE)}
+
+EMERGENCY_ADVICE=(
+    "This may be a medical emergency. Call your local emergency number now, or have someone "
+    "take you to the nearest emergency department. Do not wait for an online consultation. "
+    "If you are having thoughts of harming yourself, call or text your local crisis line right away."
+)
+
+CAUTION_ADVICE=(
+    "If this is happening now or keeps coming back, call your local emergency number or go to "
+    "the nearest emergency department."
+)
+
+
+def _trie_pattern(phrases):
+    """One regex that matches any of the phrases, factored like a trie on their words."""
+    trie={}
+    for phrase in phrases:
+        node=trie
+        for word in phrase.lower().split():
+            node=node.setdefault(word, {})
+        node[""]={}
+
+    def build(node):
+        branches=[]
+        optional=False
+        for word, child in sorted(node.items()):
+            if word == "":
+                optional=True
+                continue
+            rest=build(child)
+            branches.append(re.escape(word) + (r"\s+" + rest if rest else ""))
+        if not branches:
+            return ""
+        if len(branches) == 1 and not optional:
+            return branches[0]
+        pattern="(?:" + "|".join(branches) + ")"
+        return pattern + "?" if optional else pattern
+
+    return re.compile(r"\b" + build(trie) + r"(?:" + "|".join(_INFLECTIONS) + r")?\b", re.IGNORECASE)
+
+
+_red_flags=_trie_pattern(RED_FLAG_TERMS)
+_terms=frozenset(RED_FLAG_TERMS)
+
+
+def _canonical(term):
+    """The listed term behind an inflected match ("chest pains" -> "chest pain")."""
+    if term in _terms:
+        return term
+    for suffix in _INFLECTIONS:
+        if term.endswith(suffix) and term[:-len(suffix)] in _terms:
+            return term[:-len(suffix)]
+    return term
+
+
+def _negated(text, start):
+    """Whether a negation comes shortly before position start, within the same clause."""
+    clause=_clause_break.split(text[:start])[-1]
+    return any(word in _NEGATIONS for word in _word.findall(clause.lower())[-NEGATION_WINDOW:])
+
+
+def find_red_flags(text):
+    """Red-flag terms (as listed) found in text, in order of appearance and without repeats."""
+    # Typed and pasted text often has typographic apostrophes ("can’t"); same length, so offsets hold
+    text=(text or "").replace("\u2019", "'").replace("\u2018", "'")
+    found=[]
+    negated_end=None
+    for match in _red_flags.finditer(text):
+        term=_canonical(" ".join(match.group(0).lower().split()))
+        false_match=_false_matches.get(term)
+        if false_match and false_match.match(text, match.end()):
+            continue
+        # "no chest pain or shortness of breath": the negation carries over the list
+        listed=negated_end is not None and _list_gap.fullmatch(text, negated_end, match.start())
+        if listed or _negated(text, match.start()):
+            negated_end=match.end()
+            continue
+        negated_end=None
+        if term not in found:
+            found.append(term)
+    return found
+
+
+def is_urgent(red_flags):
+    """Whether the red flags call for the emergency answer rather than a caution."""
+    return any(term not in SOFT_RED_FLAG_TERMS for term in red_flags)
+
+
+def emergency_response(red_flags):
+    return f"""🚨 POSSIBLE EMERGENCY: {', '.join(red_flags)}
+
+📞 {EMERGENCY_ADVICE}
+
+Note: This automated check looks for warning signs only. It cannot rule an emergency in or out."""
+
+
+def caution_notice(red_flags):
+    return f"""⚠️ You mentioned: {', '.join(red_flags)}. {CAUTION_ADVICE}
+
+"""
+
+
+def priority_class(image_filepaths):
+    """Admission class of a non-emergency consult."""
+    return "image" if image_filepaths else "quick"
+
+
+class PriorityAdmission:
+    """Per-class concurrency limits for consults, with a cap on how many may wait for a slot."""
+
+    def __init__(self, limits, max_waiting=ADMISSION_MAX_WAITING):
+        self._slots={name: threading.BoundedSemaphore(limit) for name, limit in limits.items()}
+        self._waiting={name: 0 for name in limits}
+        self._max_waiting=max_waiting
+        self._lock=threading.Lock()
+
+    def try_acquire(self, priority):
+        admitted=self._slots[priority].acquire(blocking=False)
+        if admitted:
+            metrics.inc("admissions_total", priority=priority, result="admitted")
+        return admitted
+
+    def acquire(self, priority, timeout=ADMISSION_TIMEOUT):
+        with self._lock:
+            if self._waiting[priority] >= self._max_waiting:
+                metrics.inc("admissions_total", priority=priority, result="rejected")
+                return False
+            self._waiting[priority]+=1
+        try:
+            admitted=self._slots[priority].acquire(timeout=timeout)
+        finally:
+            with self._lock:
+                self._waiting[priority]-=1
+        metrics.inc("admissions_total", priority=priority, result="admitted" if admitted else "timed_out")
+        return admitted
+
+    def release(self, priority):
+        self._slots[priority].release()
+
+
+admission=PriorityAdmission({"quick": QUICK_CONCURRENCY, "image": IMAGE_CONCURRENCY})
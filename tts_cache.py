@@ -0,0 +1,41 @@
+#TTS audio cache
+#Rendered speech is keyed by (text, voice, backend) and kept on disk, so fixed answers
+#like the SYMPTOM_SOLUTIONS responses are spoken without any network call.
+import os
+import hashlib
+
+import metrics
+from shared_cache import open_cache
+
+TTS_CACHE_DIR=os.environ.get("TTS_CACHE_DIR", os.path.join(".cache", "tts"))
+TTS_CACHE_TTL=float(os.environ.get("TTS_CACHE_TTL", 30 * 24 * 3600))
+TTS_CACHE_MAX_BYTES=int(os.environ.get("TTS_CACHE_MAX_BYTES", 200 * 1024 * 1024))
+TTS_CACHE_ENABLED=os.environ.get("TTS_CACHE_ENABLED", "1") == "1"
+
+_disk_cache=open_cache("tts", TTS_CACHE_DIR, TTS_CACHE_TTL, TTS_CACHE_MAX_BYTES, suffix=".mp3")
+
+
+def make_key(input_text, voice, backend):
+    key_source="\x00".join([backend, voice, input_text])
+    return hashlib.sha256(key_source.encode("utf-8")).hexdigest()
+
+
+def get_audio(input_text, voice, backend):
+    """Cached MP3 bytes for this text/voice/backend, or None."""
+    if not TTS_CACHE_ENABLED:
+        return None
+    audio_bytes=_disk_cache.get(make_key(input_text, voice, backend))
+    if audio_bytes is None:
+        metrics.inc("cache_misses_total", cache="tts")
+    else:
+        metrics.inc("cache_hits_total", cache="tts", tier="disk")
+    return audio_bytes
+
+
+def put_audio(input_text, voice, backend, audio_bytes):
+    if not TTS_CACHE_ENABLED or not audio_bytes:
+        return
+    try:
+        _disk_cache.put(make_key(input_text, voice, backend), audio_bytes)
+    except OSError as e:
+        print(f"TTS cache write failed: {e}")
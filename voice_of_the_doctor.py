@@ -3,16 +3,24 @@
 # load_dotenv()
 
 import os
-from gtts import gTTS
-import elevenlabs
-from elevenlabs.client import ElevenLabs
+import re
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+
+import tts_cache
+from singleflight import SingleFlight
+from circuit_breaker import get_breaker
+
+GTTS_VOICE = "en"
+ELEVENLABS_VOICE = "Aria"
 
 # --- This is the only function you need for gTTS ---
 def text_to_speech_with_gtts(input_text, output_filepath):
     """Creates an audio file from text using gTTS and saves it."""
     try:
-        audio_obj = gTTS(text=input_text, lang="en", slow=False)
-        audio_obj.save(output_filepath)
+        audio_bytes = synthesize(input_text, backend="gtts")
+        with open(output_filepath, "wb") as audio_file:
+            audio_file.write(audio_bytes)
         print(f"gTTS audio saved to {output_filepath}")
         return output_filepath
     except Exception as e:
@@ -27,16 +35,116 @@ def text_to_speech_with_elevenlabs(input_text, output_filepath):
         if not ELEVEN_API_KEY:
             raise ValueError("ELEVEN_API_KEY not found in your .env file")
 
-        client = ElevenLabs(api_key=ELEVEN_API_KEY)
-        audio = client.generate(
-            text=input_text,
-            voice="Aria",
-            output_format="mp3_22050_32",
-            model="eleven_turbo_v2"
-        )
-        elevenlabs.save(audio, output_filepath)
+        # Same path as gTTS: cache, coalescing of identical renders and the circuit breaker
+        audio_bytes = synthesize(input_text, backend="elevenlabs")
+        with open(output_filepath, "wb") as audio_file:
+            audio_file.write(audio_bytes)
         print(f"ElevenLabs audio saved to {output_filepath}")
         return output_filepath
     except Exception as e:
         print(f"Error with ElevenLabs: {e}")
         return None
+
+
+# --- Progressive playback: sentence chunks synthesized in parallel ---
+TTS_WORKERS = int(os.environ.get("TTS_WORKERS", 4))
+TTS_MIN_CHUNK_CHARS = int(os.environ.get("TTS_MIN_CHUNK_CHARS", 40))
+
+_sentence_end = re.compile(r"(?<=[.!?])\s+")
+_tts_pool = ThreadPoolExecutor(max_workers=TTS_WORKERS, thread_name_prefix="tts-chunk")
+# Identical texts being rendered at the same time share one TTS request
+_tts_flights = SingleFlight("tts")
+
+
+def stream_elevenlabs_audio(input_text):
+    """Yields MP3 bytes from the ElevenLabs streaming endpoint as they arrive."""
+    ELEVEN_API_KEY = os.environ.get("ELEVEN_API_KEY")
+    if not ELEVEN_API_KEY:
+        raise ValueError("ELEVEN_API_KEY not found in your .env file")
+
+    # Loaded on first use: the SDK is slow to import and only needed with TTS_BACKEND=elevenlabs
+    from elevenlabs.client import ElevenLabs
+
+    client = ElevenLabs(api_key=ELEVEN_API_KEY)
+    yield from client.generate(
+        text=input_text,
+        voice=ELEVENLABS_VOICE,
+        output_format="mp3_22050_32",
+        model="eleven_turbo_v2",
+        stream=True
+    )
+
+
+def synthesize_with_gtts(input_text):
+    """Returns the MP3 bytes for input_text from gTTS."""
+    from gtts import gTTS
+
+    audio_buffer = BytesIO()
+    gTTS(text=input_text, lang=GTTS_VOICE, slow=False).write_to_fp(audio_buffer)
+    return audio_buffer.getvalue()
+
+
+def synthesize_with_elevenlabs(input_text):
+    """Returns the MP3 bytes for input_text from ElevenLabs."""
+    return b"".join(stream_elevenlabs_audio(input_text))
+
+
+TTS_BACKENDS = {
+    "gtts": synthesize_with_gtts,
+    "elevenlabs": synthesize_with_elevenlabs,
+}
+TTS_VOICES = {
+    "gtts": GTTS_VOICE,
+    "elevenlabs": ELEVENLABS_VOICE,
+}
+
+
+def synthesize(input_text, backend="gtts"):
+    """Returns MP3 bytes for input_text, from the TTS cache when it has been rendered before."""
+    voice = TTS_VOICES[backend]
+    audio_bytes = tts_cache.get_audio(input_text, voice, backend)
+    if audio_bytes is None:
+        audio_bytes = _tts_flights.do(tts_cache.make_key(input_text, voice, backend), _render, input_text, backend)
+    return audio_bytes
+
+
+def _render(input_text, backend):
+    # Only cache misses reach the breaker, cached answers are still spoken during an outage
+    audio_bytes = get_breaker(backend).call(TTS_BACKENDS[backend], input_text)
+    tts_cache.put_audio(input_text, TTS_VOICES[backend], backend, audio_bytes)
+    return audio_bytes
+
+
+def split_into_sentences(input_text, min_chars=TTS_MIN_CHUNK_CHARS):
+    """Splits text on sentence ends, merging short fragments so each chunk is worth a request."""
+    chunks = []
+    current = ""
+    for sentence in _sentence_end.split(input_text.strip()):
+        current = f"{current} {sentence}".strip()
+        if len(current) >= min_chars:
+            chunks.append(current)
+            current = ""
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def stream_text_to_speech(input_text, backend="gtts"):
+    """Synthesizes sentences in parallel and yields their MP3 bytes in order.
+
+    The first sentence can start playing while the rest are still being rendered.
+    """
+    futures = [_tts_pool.submit(synthesize, chunk, backend) for chunk in split_into_sentences(input_text)]
+    try:
+        for future in futures:
+            yield future.result()
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def prerender_speech(input_text, backend="gtts", chunked=False):
+    """Renders input_text into the TTS cache ahead of time (per sentence chunk when chunked)."""
+    chunks = split_into_sentences(input_text) if chunked else [input_text]
+    for chunk in chunks:
+        synthesize(chunk, backend)
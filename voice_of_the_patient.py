@@ -5,12 +5,8 @@
 #Step1: Setup Audio recorder (ffmpeg & portaudio)
 # ffmpeg, portaudio, pyaudio
 import logging
-import speech_recognition as sr
-from pydub import AudioSegment
 from io import BytesIO
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-
 def record_audio(file_path, timeout=20, phrase_time_limit=None):
     """
     Simplified function to record audio from the microphone and save it as an MP3 file.
@@ -20,6 +16,10 @@ def record_audio(file_path, timeout=20, phrase_time_limit=None):
     timeout (int): Maximum time to wait for a phrase to start (in seconds).
     phrase_time_lfimit (int): Maximum time for the phrase to be recorded (in seconds).
     """
+    # Microphone recording is only used from the command line, the web app never loads these
+    import speech_recognition as sr
+    from pydub import AudioSegment
+
     recognizer = sr.Recognizer()
     
     try:
@@ -47,19 +47,60 @@ audio_filepath="patient_voice_test_for_patient.mp3"
 
 #Step2: Setup Speech to text–STT–model for transcription
 import os
-from groq import Groq
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from groq_client import get_groq_client
+import rate_limiter
+from circuit_breaker import get_breaker
+from audio_preprocessing import prepare_audio_chunks
+import transcription_cache
 
 GROQ_API_KEY=os.environ.get("GROQ_API_KEY")
 stt_model="whisper-large-v3"
 
+TRANSCRIBE_WORKERS=int(os.environ.get("TRANSCRIBE_WORKERS", 4))
+transcription_pool=ThreadPoolExecutor(max_workers=TRANSCRIBE_WORKERS, thread_name_prefix="transcribe-chunk")
+
+def transcribe_file(client, stt_model, audio_filepath):
+    def create_transcription():
+        # Reopened on every attempt, a retried upload must start from the first byte
+        with open(audio_filepath, "rb") as audio_file:
+            return client.audio.transcriptions.create(
+                model=stt_model,
+                file=audio_file,
+                language="en"
+            )
+    with get_breaker("groq_whisper", is_ignored=rate_limiter.is_local_throttle).guard() as breaker_call:
+        transcription=rate_limiter.get_scheduler(stt_model).call(
+            create_transcription, on_admitted=breaker_call.restart_clock
+        )
+    return transcription.text.strip()
+
 def transcribe_with_groq(stt_model, audio_filepath, GROQ_API_KEY):
-    client=Groq(api_key=GROQ_API_KEY)
-    
-    audio_file=open(audio_filepath, "rb")
-    transcription=client.audio.transcriptions.create(
-        model=stt_model,
-        file=audio_file,
-        language="en"
-    )
-
-    return transcription.text
+    cache_key=transcription_cache.make_key(audio_filepath, stt_model)
+    transcript=transcription_cache.get_transcript(cache_key)
+    if transcript is None:
+        transcript=_transcribe(stt_model, audio_filepath, GROQ_API_KEY)
+        transcription_cache.put_transcript(cache_key, transcript)
+    return transcript
+
+def _transcribe(stt_model, audio_filepath, GROQ_API_KEY):
+    client=get_groq_client(GROQ_API_KEY)
+
+    with tempfile.TemporaryDirectory(prefix="stt-") as chunk_dir:
+        try:
+            chunk_paths=prepare_audio_chunks(audio_filepath, chunk_dir)
+        except Exception as e:
+            logging.warning(f"Audio preprocessing skipped, uploading the original recording: {e}")
+            chunk_paths=[audio_filepath]
+
+        if len(chunk_paths) == 1:
+            return transcribe_file(client, stt_model, chunk_paths[0])
+
+        # Long recording: transcribe the chunks in parallel and stitch them back in order
+        transcripts=transcription_pool.map(lambda chunk_path: transcribe_file(client, stt_model, chunk_path), chunk_paths)
+        return " ".join(text for text in transcripts if text)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')